@@ -0,0 +1,345 @@
+"""Офлайн-бенчмарк парсера новостей на записанных страницах источников.
+
+Снимки страниц из benchmarks/fixtures отдает локальный HTTP-сервер,
+источники реестра перенаправляются на него вместо живых сайтов.
+Измеряется:
+- загрузка + разбор каждого источника: пропускная способность, p50/p99, пик памяти;
+- совпадение быстрого и полного режима разбора на снимках;
+- полное время send_federal_news / send_belgorod_news с фейковым ботом
+  (без кэша и из кэша) и число правок, отправленных и пропущенных как повторные.
+Результат печатается в JSON, чтобы сравнивать замеры между коммитами.
+
+Запуск:
+    python benchmarks/bench_news.py --iterations 50 --output bench.json
+    python benchmarks/bench_news.py --fast --executor process
+    python benchmarks/bench_news.py --compare bench.json
+    python benchmarks/bench_news.py --record   # обновить снимки с живых сайтов
+"""
+import argparse
+import asyncio
+import dataclasses
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Бот читает токен при импорте, для бенчмарка подойдет любой
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ.setdefault("ARTICLE_DB", os.path.join(tempfile.mkdtemp(prefix="bench-articles-"), "articles.db"))
+sys.path.insert(0, ROOT)
+import botNNN  # noqa: E402
+
+
+# ===== ЛОКАЛЬНЫЙ СЕРВЕР СНИМКОВ =====
+class StubServer:
+    """HTTP-сервер, отдающий снимок источника по адресу /<ключ источника>.
+
+    failure_rate - доля ответов 500 вместо страницы.
+    """
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0):
+        pages = {}
+        for name in os.listdir(FIXTURES):
+            if name.endswith(".html"):
+                with open(os.path.join(FIXTURES, name), "rb") as f:
+                    pages["/" + name[:-5]] = f.read()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                body = pages.get(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                if latency:
+                    time.sleep(latency)
+                if failure_rate and random.random() < failure_rate:
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # потоковый режим закрывает соединение досрочно
+
+            def log_message(self, *args):
+                pass
+
+        self.pages = pages
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class FakeQuery:
+    """CallbackQuery без Telegram: запоминает правки сообщения.
+
+    У каждого запроса свое сообщение: иначе повторная правка того же текста
+    пропускается (ShownMessages) и задержка Telegram в замер не попадает.
+    """
+
+    message_ids = itertools.count(1)
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.edits = []
+        self.message = types.SimpleNamespace(chat=types.SimpleNamespace(id=1), message_id=next(self.message_ids))
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, text, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.edits.append(text)
+
+
+# ===== ИЗМЕРЕНИЯ =====
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def summarize(latencies: list, elapsed: float) -> dict:
+    """Сводка по списку задержек в секундах"""
+    return {
+        "calls": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+    }
+
+
+async def timed_runs(call, iterations: int, concurrency: int) -> dict:
+    """Выполнение call() iterations раз в concurrency параллельных потоках задач"""
+    latencies = []
+
+    async def worker(count):
+        for _ in range(count):
+            started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started)
+
+    shares = [iterations // concurrency + (i < iterations % concurrency) for i in range(concurrency)]
+    tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(count) for count in shares if count))
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = summarize(latencies, elapsed)
+    result["peak_mem_kb"] = round(peak / 1024, 1)
+    return result
+
+
+def make_parser(server: StubServer, args) -> botNNN.NewsParser:
+    """Парсер с источниками, направленными на локальный сервер"""
+    sources = [dataclasses.replace(source, url=f"{server.url}/{source.key}")
+               for source in botNNN.SOURCES.values()]
+    return botNNN.NewsParser(
+        sources=sources,
+        page_cache_dir=tempfile.mkdtemp(prefix="bench-news-"),
+        fast_parse=args.fast,
+        parse_executor=args.executor,
+        streaming=args.streaming,
+    )
+
+
+async def bench_sources(server: StubServer, args) -> dict:
+    parser = make_parser(server, args)
+    results = {}
+    try:
+        for source in parser.sources.values():
+            items = []
+
+            async def call(source=source):
+                items[:] = await parser.parse_source(source, source.max_news)
+
+            # Первый вызов прогревает соединения и пул процессов
+            await call()
+            results[source.key] = await timed_runs(call, args.iterations, args.concurrency)
+            results[source.key]["items"] = len(items)
+            results[source.key]["page_kb"] = round(len(server.pages["/" + source.key]) / 1024, 1)
+        if args.streaming:
+            results["_stream_stats"] = parser.stream_stats
+    finally:
+        await parser.aclose()
+    return results
+
+
+def check_equivalence() -> dict:
+    """Совпадение быстрого и полного режима разбора на каждом снимке"""
+    results = {}
+    for source in botNNN.SOURCES.values():
+        with open(os.path.join(FIXTURES, source.key + ".html"), encoding="utf-8") as f:
+            html = f.read()
+        results[source.key] = all(
+            botNNN.extract_news(html, max_news, source, fast=False)
+            == botNNN.extract_news(html, max_news, source, fast=True)
+            for max_news in (1, 3, 4, 6)
+        )
+    return results
+
+
+async def timed_edits(call, iterations: int, concurrency: int) -> dict:
+    """timed_runs для обработчиков кнопок: отдельно считает правки, не дошедшие до Telegram"""
+    stats = botNNN.shown_messages.stats
+    before = dict(stats)
+    result = await timed_runs(call, iterations, concurrency)
+    result["edits"] = stats["edits"] - before["edits"]
+    result["skipped_edits"] = stats["skipped"] - before["skipped"]
+    return result
+
+
+async def bench_handlers(server: StubServer, args) -> dict:
+    parser = make_parser(server, args)
+    original = botNNN.news_parser
+    botNNN.news_parser = parser
+    results = {}
+    try:
+        for name, handler in (("send_federal_news", botNNN.send_federal_news),
+                              ("send_belgorod_news", botNNN.send_belgorod_news)):
+            async def cold(handler=handler):
+                parser._cache.clear()
+                await handler(FakeQuery(args.telegram_latency))
+
+            async def cached(handler=handler):
+                await handler(FakeQuery(args.telegram_latency))
+
+            await cold()
+            results[name] = {
+                "cold": await timed_edits(cold, max(args.iterations // 5, 1), 1),
+                "cached": await timed_edits(cached, args.iterations, args.concurrency),
+            }
+    finally:
+        botNNN.news_parser = original
+        await parser.aclose()
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    with StubServer(latency=args.server_latency) as server:
+        report = {
+            "meta": {
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "iterations": args.iterations,
+                "concurrency": args.concurrency,
+                "fast_parse": args.fast,
+                "executor": args.executor,
+                "streaming": args.streaming,
+                "server_latency_s": args.server_latency,
+                "telegram_latency_s": args.telegram_latency,
+            },
+            "equivalence": check_equivalence(),
+            "sources": await bench_sources(server, args),
+            "handlers": await bench_handlers(server, args),
+        }
+    return report
+
+
+# ===== СРАВНЕНИЕ И ЗАПИСЬ СНИМКОВ =====
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    """Печать изменения p50 относительно прошлого замера. False - есть регрессия"""
+    pairs = [(f"source {key}", baseline["sources"].get(key), value)
+             for key, value in current["sources"].items() if not key.startswith("_")]
+    for name, modes in current["handlers"].items():
+        for mode, value in modes.items():
+            pairs.append((f"{name} {mode}", baseline["handlers"].get(name, {}).get(mode), value))
+
+    ok = True
+    for name, before, after in pairs:
+        if not before:
+            continue
+        ratio = after["p50_ms"] / before["p50_ms"] if before["p50_ms"] else 1.0
+        regressed = ratio > 1 + threshold
+        ok = ok and not regressed
+        mark = "❌" if regressed else "✅"
+        print(f"{mark} {name}: p50 {before['p50_ms']} -> {after['p50_ms']} мс (x{ratio:.2f})", file=sys.stderr)
+    return ok
+
+
+def record_fixtures():
+    """Перезапись снимков страницами живых сайтов"""
+    import httpx
+
+    parser = botNNN.NewsParser()
+    with httpx.Client(headers=parser.headers, timeout=botNNN.HTTP_TIMEOUT, follow_redirects=True) as client:
+        for source in botNNN.SOURCES.values():
+            response = client.get(source.url)
+            response.raise_for_status()
+            with open(os.path.join(FIXTURES, source.key + ".html"), "w", encoding="utf-8") as f:
+                f.write(response.text)
+            print(f"✅ {source.key}: {len(response.content)} байт", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--fast", action="store_true", help="быстрый режим разбора (NEWS_PARSE_MODE=fast)")
+    parser.add_argument("--executor", choices=["thread", "process"], default=botNNN.NEWS_PARSE_EXECUTOR)
+    parser.add_argument("--streaming", action="store_true", help="потоковая загрузка с досрочным обрывом")
+    parser.add_argument("--server-latency", type=float, default=0.0, help="задержка ответа сайта, с")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="задержка вызова Telegram API, с")
+    parser.add_argument("--output", help="файл для JSON (по умолчанию stdout)")
+    parser.add_argument("--compare", help="JSON прошлого замера для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимый рост p50 при сравнении")
+    parser.add_argument("--record", action="store_true", help="обновить снимки с живых сайтов и выйти")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures()
+        return
+
+    report = asyncio.run(run(args))
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    ok = all(report["equivalence"].values())
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            ok = compare(json.load(f), report, args.threshold) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""Нагрузочный тест вебхука: сколько апдейтов в секунду выдерживает путь
+webhook -> update_queue -> обработчики, пока не начинает расти задержка.
+
+Приложение Starlette работает в этом же процессе, запросы идут через
+ASGI-транспорт httpx без сети. Бот направлен на локальный фейковый Bot API
+(TELEGRAM_API_URL), источники новостей - на локальный сервер снимков;
+у обоих настраиваются задержка и доля ошибок.
+Апдейты (/start, /news, нажатия кнопок) отправляются по расписанию с
+заданной частотой и долями, не дожидаясь ответов. Частоты из --rates
+проходятся ступенями по --duration секунд. По каждой ступени в JSON:
+пропускная способность, p50/p95/p99 задержки от POST /webhook до конца
+обработки апдейта, глубина очереди во времени, прирост памяти и вызовы
+Bot API. Генератор делит цикл событий с ботом, поэтому результат -
+нижняя оценка того, что выдержит отдельный процесс бота.
+
+Запуск:
+    python benchmarks/load_webhook.py --rates 50,100,200,400 --duration 10
+    python benchmarks/load_webhook.py --mix start=1,federal_news=4 --telegram-latency 0.05
+    python benchmarks/load_webhook.py --source-failures 0.2 --cache-ttl 2 --output load.json
+"""
+import argparse
+import asyncio
+import collections
+import dataclasses
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_MIX = "start=1,news=1,federal_news=3,belgorod_news=2,refresh_news=1,help=1"
+COMMAND_KINDS = ("start", "news")
+
+
+# ===== ФЕЙКОВЫЙ BOT API =====
+class FakeTelegram:
+    """Локальный Bot API: отвечает успехом на любой метод и считает вызовы.
+
+    latency - задержка каждого ответа, failure_rate - доля ответов 500
+    (можно менять на ходу, например включить после запуска бота).
+    """
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0):
+        fake = self
+        self.failure_rate = failure_rate
+        calls = self.calls = collections.Counter()
+        lock = threading.Lock()
+        message_ids = itertools.count(1)
+
+        def result(method: str, params: dict):
+            if method == "getMe":
+                return {"id": 1, "is_bot": True, "first_name": "Load", "username": "load_test_bot"}
+            if method in ("sendMessage", "editMessageText") and "inline_message_id" not in params:
+                return {
+                    "message_id": int(params.get("message_id") or next(message_ids)),
+                    "date": int(time.time()),
+                    "chat": {"id": int(params.get("chat_id", 1)), "type": "private"},
+                    "text": params.get("text", ""),
+                }
+            return True
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Заголовки и тело уходят отдельными пакетами: без TCP_NODELAY
+            # каждый вызов ждал бы отложенного ACK (~40 мс)
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                method = self.path.rsplit("/", 1)[-1]
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    params = json.loads(body or "{}")
+                else:
+                    params = {key: values[0] for key, values in urllib.parse.parse_qs(body).items()}
+                with lock:
+                    calls[method] += 1
+                if latency:
+                    time.sleep(latency)
+                if fake.failure_rate and random.random() < fake.failure_rate:
+                    self.reply(500, {"ok": False, "error_code": 500, "description": "Internal Server Error"})
+                else:
+                    self.reply(200, {"ok": True, "result": result(method, params)})
+
+            def reply(self, code: int, payload: dict):
+                data = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# ===== АПДЕЙТЫ =====
+def parse_mix(mix: str) -> dict:
+    """Доли видов апдейтов: "start=1,federal_news=3" -> {вид: вес}"""
+    weights = {}
+    for part in mix.split(","):
+        kind, _, weight = part.partition("=")
+        weights[kind.strip()] = float(weight or 1)
+    return weights
+
+
+def make_update(kind: str, update_id: int, chat_id: int) -> dict:
+    """Апдейт Telegram: команда (start, news) или нажатие кнопки с callback_data=kind"""
+    user = {"id": chat_id, "is_bot": False, "first_name": "Load"}
+    chat = {"id": chat_id, "type": "private"}
+    if kind in COMMAND_KINDS:
+        return {"update_id": update_id, "message": {
+            "message_id": update_id, "date": int(time.time()), "chat": chat, "from": user,
+            "text": f"/{kind}", "entities": [{"type": "bot_command", "offset": 0, "length": len(kind) + 1}],
+        }}
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "from": user, "chat_instance": str(chat_id), "data": kind,
+        "message": {"message_id": 1, "date": int(time.time()), "chat": chat, "text": "📰"},
+    }}
+
+
+# ===== ИЗМЕРЕНИЯ =====
+def rss_kb() -> float:
+    """Текущий RSS процесса (на не-Linux - пиковый)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def counter_delta(after: dict, before: dict) -> dict:
+    return {key: value - before.get(key, 0) for key, value in after.items() if value != before.get(key, 0)}
+
+
+class LoadTest:
+    """Ступени нагрузки на вебхук бота, запущенного в этом процессе"""
+
+    def __init__(self, bot, client, telegram: FakeTelegram, args):
+        self.bot = bot
+        self.client = client
+        self.telegram = telegram
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.mix = parse_mix(args.mix)
+        self.update_ids = itertools.count(1)
+        self.sent_at = {}       # update_id -> время отправки
+        self.completed_at = {}  # update_id -> время конца обработки
+        self.errors = collections.Counter()
+
+        # Конец обработки апдейта отмечается в обработчике очереди бота
+        processor = bot.update_processor
+        do_process_update = processor.do_process_update
+
+        async def timed(update, coroutine):
+            try:
+                await do_process_update(update, coroutine)
+            finally:
+                self.completed_at[update.update_id] = time.perf_counter()
+
+        processor.do_process_update = timed
+
+    async def on_error(self, update, context):
+        """Обработчик ошибок бота: считает их вместо трассировок в логе"""
+        self.errors[type(context.error).__name__] += 1
+
+    async def post(self, update_id: int, payload: bytes, statuses: collections.Counter):
+        self.sent_at[update_id] = time.perf_counter()
+        response = await self.client.post("/webhook", content=payload, headers={"Content-Type": "application/json"})
+        statuses[response.status_code] += 1
+
+    async def sample_depth(self, started: float, samples: list):
+        """Глубина очереди: апдейты, принятые и не обработанные, и длина update_queue"""
+        while True:
+            samples.append((round(time.perf_counter() - started, 2), self.bot.update_processor.pending,
+                            self.bot.application.update_queue.qsize()))
+            await asyncio.sleep(self.args.sample_interval)
+
+    async def run_step(self, rate: float) -> dict:
+        from bench_news import percentile
+
+        args = self.args
+        kinds, weights = list(self.mix), list(self.mix.values())
+        total = max(int(rate * args.duration), 1)
+        statuses = collections.Counter()
+        samples = []
+        telegram_before = dict(self.telegram.calls)
+        verdicts_before = dict(self.bot.refresh_limiter.stats)
+        errors_before = dict(self.errors)
+        rss_before = rss_kb()
+        step_ids = []
+        pending = set()
+
+        started = time.perf_counter()
+        sampler = asyncio.create_task(self.sample_depth(started, samples))
+        for i in range(total):
+            # Открытая модель нагрузки: апдейты уходят по расписанию, не дожидаясь ответов
+            delay = started + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            update_id = next(self.update_ids)
+            step_ids.append(update_id)
+            kind = self.rng.choices(kinds, weights)[0]
+            payload = json.dumps(make_update(kind, update_id, self.rng.randrange(args.chats) + 1)).encode()
+            task = asyncio.create_task(self.post(update_id, payload, statuses))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        send_seconds = time.perf_counter() - started
+        await asyncio.gather(*pending)
+
+        # Ждем обработки всех принятых апдейтов (не дольше --drain-timeout)
+        drain_until = time.perf_counter() + args.drain_timeout
+        while self.bot.update_processor.pending and time.perf_counter() < drain_until:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+
+        latencies = sorted(self.completed_at[u] - self.sent_at[u] for u in step_ids if u in self.completed_at)
+        result = {
+            "target_rate_ups": rate,
+            "sent": total,
+            "send_seconds": round(send_seconds, 2),
+            "accepted": statuses[200],
+            "rejected": statuses[503],
+            "failed": sum(count for code, count in statuses.items() if code not in (200, 503)),
+            "completed": len(latencies),
+            "throughput_ups": round(len(latencies) / elapsed, 2),
+            "handler_errors": counter_delta(self.errors, errors_before),
+            "queue_depth": {
+                "max_pending": max((pending for _, pending, _ in samples), default=0),
+                "samples": samples,
+            },
+            "memory_kb": {
+                "rss_before": round(rss_before, 1),
+                "rss_after": round(rss_kb(), 1),
+                "growth": round(rss_kb() - rss_before, 1),
+            },
+            "telegram_calls": counter_delta(dict(self.telegram.calls), telegram_before),
+            "refresh_verdicts": counter_delta(self.bot.refresh_limiter.stats, verdicts_before),
+        }
+        if latencies:
+            result.update({
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+                "max_ms": round(latencies[-1] * 1000, 2),
+            })
+        return result
+
+
+def sustained(step: dict, slo_p99_ms: float) -> bool:
+    """Ступень выдержана: все апдейты приняты и обработаны, p99 в пределах SLO"""
+    return (step["completed"] == step["sent"] and not step["rejected"]
+            and step.get("p99_ms", float("inf")) <= slo_p99_ms)
+
+
+async def run(args, telegram: FakeTelegram) -> dict:
+    import httpx
+    import botNNN
+    from bench_news import StubServer, git_revision
+
+    with StubServer(latency=args.source_latency, failure_rate=args.source_failures) as server:
+        # Парсер с источниками на локальном сервере; слушатели (хранилище, индекс) - от основного
+        sources = [dataclasses.replace(source, url=f"{server.url}/{source.key}")
+                   for source in botNNN.SOURCES.values()]
+        parser = botNNN.NewsParser(sources=sources, cache_ttl=args.cache_ttl,
+                                   page_cache_dir=tempfile.mkdtemp(prefix="load-news-"))
+        parser.listeners = botNNN.news_parser.listeners
+        botNNN.news_parser = parser
+
+        app = botNNN.create_app()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bot") as client:
+            async with botNNN.lifespan(app):
+                while not botNNN.readiness.ready:
+                    await asyncio.sleep(0.05)
+                # Ошибки Bot API - только под нагрузкой: запуск бота без getMe не пройдет
+                telegram.failure_rate = args.telegram_failures
+                test = LoadTest(botNNN, client, telegram, args)
+                botNNN.application.add_error_handler(test.on_error)
+
+                steps = []
+                for rate in args.rates:
+                    step = await test.run_step(rate)
+                    step["sustained"] = sustained(step, args.slo_p99)
+                    steps.append(step)
+                    print(f"{'✅' if step['sustained'] else '❌'} {rate:g} апд/с: "
+                          f"{step['throughput_ups']} апд/с, p99 {step.get('p99_ms')} мс, "
+                          f"отклонено {step['rejected']}", file=sys.stderr)
+
+    passed = [step["target_rate_ups"] for step in steps if step["sustained"]]
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "duration_s": args.duration,
+            "mix": parse_mix(args.mix),
+            "chats": args.chats,
+            "telegram_latency_s": args.telegram_latency,
+            "telegram_failures": args.telegram_failures,
+            "source_latency_s": args.source_latency,
+            "source_failures": args.source_failures,
+            "cache_ttl_s": args.cache_ttl,
+            "slo_p99_ms": args.slo_p99,
+            "webhook_concurrency": botNNN.WEBHOOK_CONCURRENCY,
+            "webhook_max_pending": botNNN.WEBHOOK_MAX_PENDING,
+        },
+        "max_sustained_rate_ups": max(passed, default=None),
+        "steps": steps,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rates", default="25,50,100,200", help="ступени частоты апдейтов в секунду, через запятую")
+    parser.add_argument("--duration", type=float, default=10, help="длительность каждой ступени, с")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="доли видов апдейтов: команды start/news и callback_data")
+    parser.add_argument("--chats", type=int, default=500, help="число разных чатов, от которых идут апдейты")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="задержка ответа Bot API, с")
+    parser.add_argument("--telegram-failures", type=float, default=0.0, help="доля ответов Bot API с ошибкой 500")
+    parser.add_argument("--source-latency", type=float, default=0.0, help="задержка ответа сайта новостей, с")
+    parser.add_argument("--source-failures", type=float, default=0.0, help="доля ответов сайта с ошибкой 500")
+    parser.add_argument("--cache-ttl", type=float, default=300, help="свежесть кэша заголовков, с (меньше - чаще к сайтам)")
+    parser.add_argument("--slo-p99", type=float, default=1000, help="p99 задержки, при котором ступень выдержана, мс")
+    parser.add_argument("--sample-interval", type=float, default=0.25, help="период замера глубины очереди, с")
+    parser.add_argument("--drain-timeout", type=float, default=30, help="сколько ждать обработки после ступени, с")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="файл для JSON (по умолчанию stdout)")
+    parser.add_argument("--verbose", action="store_true", help="не приглушать логи бота")
+    args = parser.parse_args()
+    args.rates = [float(rate) for rate in args.rates.split(",")]
+
+    with FakeTelegram(args.telegram_latency) as telegram:
+        # Адрес Bot API бот читает при импорте, поэтому импорт - после запуска заглушки
+        os.environ["TELEGRAM_API_URL"] = telegram.url
+        os.environ.setdefault("RENDER_EXTERNAL_URL", "http://load-test.invalid")
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import bench_news  # noqa: F401 - импортирует бота
+
+        if not args.verbose:
+            import logging
+            logging.getLogger().setLevel(logging.WARNING)
+            logging.getLogger("httpx").setLevel(logging.WARNING)
+        report = asyncio.run(run(args, telegram))
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,77 @@
 import os
 import logging
-import requests
 import asyncio
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
-from bs4 import BeautifulSoup
+import bisect
+import contextlib
+import functools
+import hashlib
+import heapq
+import importlib.util
+import itertools
+import json
+import multiprocessing
+import random
+import re
+import socket
+import sqlite3
+import tempfile
+import urllib.parse
+from collections import deque
+from dataclasses import dataclass, field, fields, replace
+from html.parser import HTMLParser
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# ===== ПРОФИЛЬ ЗАПУСКА =====
+class StartupProfile:
+    """Время этапов запуска процесса: импорты, инициализация, прогрев"""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.stages = []  # (этап, начало от старта, длительность) в секундах
+    
+    def mark(self, name: str):
+        """Конец этапа, начавшегося сразу после предыдущей отметки (импорты модуля)"""
+        now = time.perf_counter()
+        self.stages.append((name, self._last - self.started, now - self._last))
+        self._last = now
+    
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Этап, который может идти одновременно с другими"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, started - self.started, time.perf_counter() - started))
+    
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+    
+    def report(self) -> str:
+        return "\n".join(f"{name:<24} +{offset:6.3f} с {duration:7.3f} с" for name, offset, duration in self.stages)
+
+startup_profile = StartupProfile()
+
+import httpx
+startup_profile.mark('import httpx')
+from telegram import (Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle,
+                      InputTextMessageContent)
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+from telegram.request import HTTPXRequest
+from telegram.ext import (Application, BaseUpdateProcessor, CommandHandler, CallbackQueryHandler, ContextTypes,
+                          InlineQueryHandler)
+startup_profile.mark('import telegram')
 from starlette.applications import Starlette
 from starlette.routing import Route
 from starlette.requests import Request
 from starlette.responses import Response, PlainTextResponse
-import uvicorn
+startup_profile.mark('import starlette')
+# bs4/soupsieve импортируются при первом разборе страницы, uvicorn - при запуске
+# сервера: для первого ответа они не нужны, а воркеры пула разбора не поднимают сервер
 
 # Настройка логгирования
 logging.basicConfig(
@@ -18,308 +80,2170 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# STARTUP_PROFILE=1 - подробный отчет о времени этапов запуска в лог
+STARTUP_PROFILE = os.environ.get("STARTUP_PROFILE", "0") == "1"
+
 # Настройки вебхука для Render
 TOKEN = os.environ["BOT_TOKEN"]  # Токен из переменных окружения
 PORT = int(os.environ.get("PORT", 8000))
 WEBHOOK_URL = os.environ.get("RENDER_EXTERNAL_URL", "") + "/webhook"
+# Адрес Bot API (свой сервер Bot API или локальная заглушка в нагрузочном тесте)
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org")
+
+# Число процессов uvicorn; при нескольких нужен общий кэш (CACHE_BACKEND)
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 1))
+
+# Настройки кэша новостей
+NEWS_CACHE_TTL = float(os.environ.get("NEWS_CACHE_TTL", 300))  # секунды свежести заголовков
+
+# Общий для воркеров кэш заголовков и блокировка загрузки: "memory" (свой у каждого
+# процесса), "sqlite" (файл CACHE_BACKEND_URL) или "redis" (redis://[:пароль@]хост:порт/база)
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+CACHE_BACKEND_URL = os.environ.get("CACHE_BACKEND_URL")
+BACKEND_TIMEOUT = float(os.environ.get("BACKEND_TIMEOUT", 2))
+BACKEND_POLL_INTERVAL = 0.2    # как часто проверять результат загрузки другого воркера
+BACKEND_ENTRY_TTL = 24 * 3600  # сколько хранить заголовки в общем кэше (устаревшие тоже нужны)
+BACKEND_OWNER = f"{socket.gethostname()}:{os.getpid()}:{os.urandom(3).hex()}"
+
+# Каталог дискового кэша страниц (можно указать на постоянный диск Render)
+PAGE_CACHE_DIR = os.environ.get("PAGE_CACHE_DIR", ".news_cache")
+
+# Быстрый разбор: строится дерево только из контейнеров новостей (SoupStrainer)
+NEWS_FAST_PARSE = os.environ.get("NEWS_PARSE_MODE", "full") == "fast"
+# Движок для быстрого разбора: "lxml" (по умолчанию, если установлен) или "html.parser".
+# Наличие lxml проверяется без импорта, чтобы не замедлять запуск
+HAS_LXML = importlib.util.find_spec("lxml") is not None
+NEWS_HTML_BACKEND = os.environ.get("NEWS_HTML_BACKEND", "lxml" if HAS_LXML else "html.parser")
+if NEWS_HTML_BACKEND not in ("lxml", "html.parser") or (NEWS_HTML_BACKEND == "lxml" and not HAS_LXML):
+    logger.warning(f"⚠️ Движок разбора {NEWS_HTML_BACKEND} недоступен, используется html.parser")
+    NEWS_HTML_BACKEND = "html.parser"
+
+# Где выполнять разбор HTML: "thread" (пул потоков) или "process" (пул процессов)
+NEWS_PARSE_EXECUTOR = os.environ.get("NEWS_PARSE_EXECUTOR", "thread")
+NEWS_PARSE_WORKERS = int(os.environ.get("NEWS_PARSE_WORKERS", os.cpu_count() or 2))
+# Через сколько задач воркер процесса пересоздается (каждое пересоздание - ~0.1 с
+# на повторное выполнение модуля бота в воркере, см. parse_mp_context)
+NEWS_PARSE_MAX_TASKS_PER_CHILD = int(os.environ.get("NEWS_PARSE_MAX_TASKS_PER_CHILD", 200))
+
+# Потоковая загрузка с обрывом соединения, как только найдено достаточно новостей
+NEWS_STREAMING = os.environ.get("NEWS_STREAMING", "0") == "1"
+# Через сколько символов полученного HTML пробовать первый разбор недокачанной страницы
+# (следующие - каждый раз, когда полученная часть вырастет вдвое)
+NEWS_STREAM_CHECK_CHARS = int(os.environ.get("NEWS_STREAM_CHECK_CHARS", 32768))
+
+# Настройки HTTP-клиента для загрузки источников
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 15))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", 20))
+HTTP_PER_HOST_LIMIT = int(os.environ.get("HTTP_PER_HOST_LIMIT", 4))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", 60))
+
+# Brotli поддерживается, только если установлен пакет brotli
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+# Файловая блокировка подписок между воркерами есть только на Unix
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Склейка почти одинаковых заголовков разных источников
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", 0.6))  # доля общих слов
+DEDUP_MIN_WORDS = 3
+DEDUP_BANDS, DEDUP_ROWS = 16, 2  # LSH: 16 полос по 2 значения MinHash
+
+# Общий бюджет ожидания источников на один запрос пользователя
+NEWS_DEADLINE = float(os.environ.get("NEWS_DEADLINE", 4))
+# Через сколько секунд запускать резервные источники, если основные медлят
+NEWS_HEDGE_DELAY = float(os.environ.get("NEWS_HEDGE_DELAY", 1.5))
+# Новостей на одной странице экрана категории (дальше - кнопка "Далее ▶")
+NEWS_PAGE_SIZE = int(os.environ.get("NEWS_PAGE_SIZE", 6))
+# Предохранители источников: сколько ошибок подряд размыкают, через сколько секунд
+# пробовать снова (ожидание удваивается при неудачной пробе до максимума)
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", 3))
+BREAKER_COOLDOWN = float(os.environ.get("BREAKER_COOLDOWN", 30))
+BREAKER_MAX_COOLDOWN = float(os.environ.get("BREAKER_MAX_COOLDOWN", 600))
+# Адаптивный таймаут: перцентиль последних BREAKER_WINDOW задержек, умноженный на запас
+BREAKER_WINDOW = 50
+BREAKER_MIN_SAMPLES = 5
+BREAKER_TIMEOUT_PERCENTILE = float(os.environ.get("BREAKER_TIMEOUT_PERCENTILE", 0.95))
+BREAKER_TIMEOUT_FACTOR = float(os.environ.get("BREAKER_TIMEOUT_FACTOR", 3))
+BREAKER_MIN_TIMEOUT = float(os.environ.get("BREAKER_MIN_TIMEOUT", 2))
+# Заглушка «Загружаю...» показывается, только если новости не готовы за это время
+NEWS_PLACEHOLDER_DELAY = float(os.environ.get("NEWS_PLACEHOLDER_DELAY", 0.3))
+# Показ новостей по мере ответа источников и минимальный интервал между такими правками
+NEWS_PROGRESSIVE = os.environ.get("NEWS_PROGRESSIVE", "1") == "1"
+NEWS_EDIT_INTERVAL = float(os.environ.get("NEWS_EDIT_INTERVAL", 1))
+
+# Прием вебхуков: сколько апдейтов может ждать обработки и сколько обрабатывается одновременно
+WEBHOOK_MAX_PENDING = int(os.environ.get("WEBHOOK_MAX_PENDING", 1000))
+WEBHOOK_CONCURRENCY = int(os.environ.get("WEBHOOK_CONCURRENCY", 32))
+
+# orjson разбирает JSON апдейтов быстрее, но необязателен
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# ===== МЕТРИКИ =====
+# Границы корзин гистограмм: задержки в секундах и число новостей
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ITEMS_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10)
+
+def escape_label(value) -> str:
+    """Значение метки Prometheus: экранируются обратная косая черта, кавычки и переводы строк"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Histogram:
+    """Счетчики попаданий в корзины с фиксированными границами"""
+    
+    __slots__ = ('bounds', 'counts', 'sum')
+    
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # последняя корзина - +Inf
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+class Metrics:
+    """Метрики в текстовом формате Prometheus для /metrics.
+    
+    Запись на горячем пути - поиск корзины и пара сложений в словаре:
+    все происходит в одном цикле событий, блокировки не нужны.
+    Счетчики, которые компоненты уже ведут в своих stats, не дублируются,
+    а читаются в момент выгрузки через collect().
+    """
+    
+    def __init__(self):
+        self._families = {}    # имя -> (тип, описание, имена меток, границы корзин, {значения меток: значение})
+        self._collectors = []  # (имя, тип, описание, имена меток, функция -> {значения меток: значение})
+    
+    def counter(self, name: str, help: str, labels: tuple = ()):
+        self._families[name] = ('counter', help, labels, None, {})
+    
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self._families[name] = ('histogram', help, labels, buckets, {})
+    
+    def collect(self, name: str, kind: str, help: str, labels: tuple, func):
+        """Метрика, значения которой вычисляются при каждой выгрузке"""
+        self._collectors.append((name, kind, help, labels, func))
+    
+    def inc(self, name: str, *label_values, amount: float = 1):
+        values = self._families[name][4]
+        values[label_values] = values.get(label_values, 0) + amount
+    
+    def observe(self, name: str, value: float, *label_values):
+        _, _, _, buckets, values = self._families[name]
+        histogram = values.get(label_values)
+        if histogram is None:
+            histogram = values[label_values] = Histogram(buckets)
+        histogram.observe(value)
+    
+    def value(self, name: str, *label_values) -> float:
+        return self._families[name][4].get(label_values, 0)
+    
+    @staticmethod
+    def _labels(names: tuple, values: tuple, le: str = None) -> str:
+        pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+        if le is not None:
+            pairs.append(f'le="{le}"')
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+    
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help, labels, _, values) in self._families.items():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for label_values, value in list(values.items()):
+                if kind != 'histogram':
+                    lines.append(f"{name}{self._labels(labels, label_values)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(value.bounds + ('+Inf',), value.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._labels(labels, label_values, bound)} {cumulative}")
+                lines.append(f"{name}_sum{self._labels(labels, label_values)} {value.sum}")
+                lines.append(f"{name}_count{self._labels(labels, label_values)} {cumulative}")
+        
+        for name, kind, help, labels, func in self._collectors:
+            try:
+                values = func()
+            except Exception as e:
+                logger.warning(f"⚠️ Метрика {name} недоступна: {e}")
+                continue
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for label_values, value in values.items():
+                lines.append(f"{name}{self._labels(labels, label_values)} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+metrics.histogram('news_fetch_seconds', 'Загрузка страницы источника', ('source',))
+metrics.histogram('news_parse_seconds', 'Разбор HTML источника, включая ожидание пула', ('source',))
+metrics.histogram('news_items', 'Новостей за одну загрузку источника', ('source',), ITEMS_BUCKETS)
+metrics.counter('news_cache_requests_total', 'Запросы к кэшу заголовков', ('result',))
+metrics.histogram('update_latency_seconds', 'От приема вебхука до конца обработки апдейта', ('type',))
+metrics.histogram('telegram_api_seconds', 'Вызовы Telegram Bot API', ('method',))
+metrics.counter('telegram_api_errors_total', 'Ошибки вызовов Telegram Bot API', ('method', 'reason'))
+
+@functools.lru_cache(maxsize=None)
+def ssl_context():
+    """Один SSL-контекст на процесс: загрузка корневых сертификатов занимает десятки мс на каждый клиент"""
+    return httpx.create_ssl_context()
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest с замером вызовов Bot API и подсчетом ошибок по методам"""
+    
+    def _build_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(**self._client_kwargs, verify=ssl_context())
+    
+    async def do_request(self, url: str, method: str, *args, **kwargs) -> tuple:
+        api_method = url.rsplit('/', 1)[-1] if method == 'POST' else 'file'
+        started = time.monotonic()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except TelegramError as e:
+            metrics.inc('telegram_api_errors_total', api_method, type(e).__name__)
+            raise
+        finally:
+            metrics.observe('telegram_api_seconds', time.monotonic() - started, api_method)
+        if code != 200:
+            metrics.inc('telegram_api_errors_total', api_method, str(code))
+        return code, payload
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка апдейтов с сохранением порядка внутри одного чата.
+    
+    Апдейты одного чата ждут друг друга на замке чата, не занимая общих
+    слотов, поэтому медленный чат не задерживает остальные.
+    Также считает апдейты, принятые вебхуком и еще не обработанные,
+    и замеряет время от приема вебхука до конца обработки.
+    """
+    
+    def __init__(self, concurrency: int, max_pending: int):
+        # Семафор базового класса не должен ограничивать раньше замка чата,
+        # поэтому он рассчитан на все ожидающие апдейты, а общий лимит - свой
+        super().__init__(max(max_pending, concurrency))
+        self.concurrency = concurrency
+        self._workers = None
+        self._chat_locks = {}  # чат -> [замок, число апдейтов чата в работе]
+        self.pending = 0
+        self.accepted = 0
+        self.rejected = 0
+        self._received = {}  # update_id -> время приема вебхуком
+    
+    def admit(self, update: Update):
+        """Учет апдейта, поставленного вебхуком в очередь"""
+        self.pending += 1
+        self.accepted += 1
+        self._received[update.update_id] = time.monotonic()
+    
+    async def do_process_update(self, update, coroutine):
+        chat = (update.effective_chat or update.effective_user) if isinstance(update, Update) else None
+        chat_id = chat.id if chat else None
+        received_at = self._received.pop(update.update_id, None) if isinstance(update, Update) else None
+        try:
+            if chat_id is None:
+                async with self._workers:
+                    await coroutine
+                return
+            
+            entry = self._chat_locks.setdefault(chat_id, [asyncio.Lock(), 0])
+            entry[1] += 1
+            try:
+                async with entry[0], self._workers:
+                    await coroutine
+            finally:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._chat_locks[chat_id]
+        finally:
+            self.pending -= 1
+            if received_at is not None:
+                metrics.observe('update_latency_seconds', time.monotonic() - received_at, update_type(update))
+    
+    async def initialize(self):
+        self._workers = asyncio.Semaphore(self.concurrency)
+    
+    async def shutdown(self):
+        pass
+
+def update_type(update: Update) -> str:
+    """Метка апдейта для метрик: данные кнопки, известная команда или вид сообщения"""
+    if update.callback_query:
+        return (update.callback_query.data or 'callback').split(':', 1)[0]
+    if update.inline_query:
+        return 'inline'
+    text = update.message.text if update.message else None
+    if text and text.startswith('/'):
+        command = text.split()[0][1:].split('@')[0]
+        return f"/{command}" if command in COMMANDS else 'command'
+    return 'message' if update.message else 'other'
+
+update_processor = ChatOrderedUpdateProcessor(WEBHOOK_CONCURRENCY, WEBHOOK_MAX_PENDING)
+
+# Ограничение частоты кнопок обновления новостей (токены в секунду и запас)
+RATE_CHAT_PER_SEC = float(os.environ.get("RATE_CHAT_PER_SEC", 0.2))
+RATE_CHAT_BURST = int(os.environ.get("RATE_CHAT_BURST", 3))
+RATE_GLOBAL_PER_SEC = float(os.environ.get("RATE_GLOBAL_PER_SEC", 20))
+RATE_GLOBAL_BURST = int(os.environ.get("RATE_GLOBAL_BURST", 40))
+# Повторные нажатия той же кнопки в этом окне (секунды) схлопываются в одно обновление
+REFRESH_DEBOUNCE = float(os.environ.get("REFRESH_DEBOUNCE", 3))
+
+# Хранилище всех извлеченных новостей
+ARTICLE_DB = os.environ.get("ARTICLE_DB", os.path.join(PAGE_CACHE_DIR, "articles.db"))
+STORE_FLUSH_INTERVAL = float(os.environ.get("STORE_FLUSH_INTERVAL", 10))
+STORE_RETENTION_DAYS = float(os.environ.get("STORE_RETENTION_DAYS", 7))
+
+# Inline-поиск заголовков (@бот запрос): размер индекса и выдачи, кэш ответа в Telegram
+INDEX_MAX_ITEMS = int(os.environ.get("INDEX_MAX_ITEMS", 5000))
+INLINE_MAX_RESULTS = 20
+INLINE_CACHE_TIME = int(os.environ.get("INLINE_CACHE_TIME", 60))
+
+# Рассылка новых заголовков подписчикам
+SUBSCRIPTIONS_FILE = os.environ.get("SUBSCRIPTIONS_FILE", os.path.join(PAGE_CACHE_DIR, "subscriptions.json"))
+DIGEST_INTERVAL = float(os.environ.get("DIGEST_INTERVAL", 900))  # секунды между опросами
+DIGEST_MAX_NEWS = int(os.environ.get("DIGEST_MAX_NEWS", 8))
+# Telegram допускает около 30 сообщений в секунду на бота и около 1 в секунду в один чат
+BROADCAST_RATE = float(os.environ.get("BROADCAST_RATE", 25))
+BROADCAST_CHAT_INTERVAL = float(os.environ.get("BROADCAST_CHAT_INTERVAL", 1))
+BROADCAST_BATCH = int(os.environ.get("BROADCAST_BATCH", 25))
+BROADCAST_RETRIES = int(os.environ.get("BROADCAST_RETRIES", 3))
 
 # Создаем приложение Telegram
-application = Application.builder().token(TOKEN).build()
+application = (
+    Application.builder()
+    .token(TOKEN)
+    .base_url(f"{TELEGRAM_API_URL}/bot")
+    .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+    .request(InstrumentedRequest(connection_pool_size=256))
+    .get_updates_request(InstrumentedRequest())
+    .update_queue(asyncio.Queue(maxsize=WEBHOOK_MAX_PENDING))
+    .concurrent_updates(update_processor)
+    .build()
+)
+
+# ===== БЫСТРЫЙ РАЗБОР HTML =====
+# Простые CSS-селекторы, которые можно проверить еще при разборе: tag, .class, [attr], [attr="v"], [attr*="v"]
+_SIMPLE_SELECTOR = re.compile(r'^(?:(?P<tag>[a-z][a-z0-9]*)|\.(?P<cls>[\w-]+)|\[(?P<attr>[\w-]+)(?:(?P<op>\*?=)"(?P<value>[^"]*)")?\])$')
+
+def selector_strainer(selector: str):
+    """SoupStrainer, пропускающий при разборе только элементы, подходящие под селектор.
+    
+    Для сложных селекторов возвращает None - тогда источник разбирается целиком.
+    При разборе атрибут class приходит строкой, поэтому сравнение идет по ее словам.
+    """
+    parts = []
+    for part in selector.split(','):
+        match = _SIMPLE_SELECTOR.match(part.strip())
+        if not match:
+            return None
+        parts.append(match.groupdict())
+    
+    def matches(name, attrs):
+        for part in parts:
+            if part['tag']:
+                if name == part['tag']:
+                    return True
+                continue
+            key = 'class' if part['cls'] else part['attr']
+            value = attrs.get(key)
+            if value is None:
+                continue
+            if not isinstance(value, str):
+                value = ' '.join(value)
+            if part['cls']:
+                if part['cls'] in value.split():
+                    return True
+            elif (part['op'] is None
+                  or (part['op'] == '=' and value == part['value'])
+                  or (part['op'] == '*=' and part['value'] in value)):
+                return True
+        return False
+    from bs4 import SoupStrainer
+    return SoupStrainer(matches)
+
+@functools.lru_cache(maxsize=None)
+def link_strainer():
+    """SoupStrainer для отбора по всем ссылкам страницы"""
+    from bs4 import SoupStrainer
+    return SoupStrainer('a', href=True)
+
+def make_soup(html: str, strainer, fast: bool):
+    """Дерево страницы: полное или, в быстром режиме, только из нужных поддеревьев"""
+    from bs4 import BeautifulSoup
+    if fast and strainer is not None:
+        return BeautifulSoup(html, NEWS_HTML_BACKEND, parse_only=strainer)
+    return BeautifulSoup(html, 'html.parser')
+
+# ===== РЕЕСТР ИСТОЧНИКОВ =====
+@dataclass(frozen=True)
+class LinkRule:
+    """Правило отбора новостей среди всех ссылок страницы"""
+    min_title: int = 21
+    href_contains: str = ''
+    href_markers: tuple = ()  # в ссылке должен быть хотя бы один маркер
+    keywords: tuple = ()      # в заголовке должно быть хотя бы одно слово
+    
+    def matches(self, href: str, title: str) -> bool:
+        if len(title) < self.min_title:
+            return False
+        if self.href_contains and self.href_contains not in href:
+            return False
+        if self.href_markers and not any(marker in href for marker in self.href_markers):
+            return False
+        if self.keywords and not any(word in title.lower() for word in self.keywords):
+            return False
+        return True
+
+@dataclass(frozen=True)
+class NewsSource:
+    """Описание источника новостей.
+    
+    Новости ищутся в контейнерах containers (заголовок - titles, ссылка -
+    первая <a href> или атрибут link_attr). Если контейнеров нет или они
+    ничего не дали, применяется отбор по ссылкам links.
+    Селекторы компилируются один раз, при первом разборе источника.
+    """
+    key: str
+    name: str
+    category: str
+    url: str
+    base: str
+    containers: str = None
+    titles: str = None
+    link_attr: str = None
+    min_title: int = 10
+    max_title: int = 150
+    scan_factor: int = 2      # сколько контейнеров просматривать на одну новость
+    links: LinkRule = None
+    reserve: bool = False     # резервный источник категории
+    max_news: int = 5         # сколько новостей брать для экрана категории
+    timeout: float = HTTP_TIMEOUT
+    concurrency: int = HTTP_PER_HOST_LIMIT
+    
+    # cached_property пишет прямо в __dict__, поэтому работает и у frozen-записи
+    @functools.cached_property
+    def container_plan(self):
+        import soupsieve
+        return soupsieve.compile(self.containers) if self.containers else None
+    
+    @functools.cached_property
+    def title_plan(self):
+        import soupsieve
+        return soupsieve.compile(self.titles) if self.titles else None
+    
+    @functools.cached_property
+    def strainer(self):
+        return selector_strainer(self.containers) if self.containers else link_strainer()
+    
+    def __reduce__(self):
+        # В пул процессов передаются только поля описания, планы собираются заново
+        return (self.__class__, tuple(getattr(self, f.name) for f in fields(self)))
+
+SOURCES = {source.key: source for source in [
+    NewsSource(
+        key='ria', name='RIA Новости', category='federal',
+        url='https://ria.ru/', base='https://ria.ru',
+        containers='[data-type="article"], .cell-list__item, .list-item, article',
+        titles='.cell-list__item-title, .list-item__title, h2, h3',
+        min_title=10, max_title=150, scan_factor=2, max_news=4,
+    ),
+    NewsSource(
+        key='tass', name='ТАСС', category='federal',
+        url='https://tass.ru/', base='https://tass.ru',
+        containers='.news-card, .news-line__item, [data-io-article-url]',
+        titles='.news-card__title, .news-line__item-title, h3',
+        link_attr='data-io-article-url',
+        min_title=10, max_title=150, scan_factor=2, max_news=4,
+    ),
+    NewsSource(
+        key='belpressa', name='БелПресса', category='belgorod',
+        url='https://www.belpressa.ru/news/', base='https://www.belpressa.ru',
+        containers='.news-item, article, .item, .news-list__item',
+        titles='h2, h3, .title, .news-title',
+        min_title=15, max_title=200, scan_factor=3, max_news=3,
+        links=LinkRule(href_contains='/news/', href_markers=('2024', '2025')),
+    ),
+    NewsSource(
+        key='belru', name='Бел.Ру', category='belgorod',
+        url='https://bel.ru/news/', base='https://bel.ru',
+        containers='.news-item, article, .item, [class*="news"]',
+        titles='h1, h2, h3, h4, .title, .news-title',
+        min_title=15, max_title=200, scan_factor=3, max_news=3,
+    ),
+    NewsSource(
+        key='belnovosti', name='БелНовости', category='belgorod', reserve=True,
+        url='https://www.belnovosti.ru/', base='https://www.belnovosti.ru',
+        links=LinkRule(keywords=('белгород', 'област', 'город', 'новост')),
+        max_title=150, max_news=6, timeout=10,
+    ),
+]}
+
+def link_hash(link: str) -> str:
+    return hashlib.sha1(link.encode()).hexdigest()[:16]
+
+@dataclass(frozen=True, slots=True)
+class NewsItem:
+    """Новость источника.
+    
+    Заголовки одновременно живут в кэше парсера, индексе поиска и буферах
+    страниц, поэтому хранятся в слотах, а не в словаре. Хэш ссылки считается
+    один раз: он нужен хранилищу, inline-режиму и курсорам страниц.
+    В JSON (дисковый и общий кэш) новость пишется списком полей.
+    """
+    title: str
+    link: str
+    source: str
+    fetched_at: float = field(compare=False)  # когда заголовок получен (unix time)
+    also: tuple = ()                          # другие источники того же сюжета
+    link_hash: str = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        object.__setattr__(self, 'link_hash', link_hash(self.link))
+    
+    def to_json(self) -> list:
+        return [self.title, self.link, self.source, self.fetched_at]
+    
+    @classmethod
+    def from_json(cls, value) -> 'NewsItem':
+        # Записи кэшей до появления NewsItem - словари без времени получения
+        if isinstance(value, dict):
+            return cls(value['title'], value['link'], value['source'], 0.0)
+        return cls(*value)
+
+def _absolute(link: str, base: str) -> str:
+    return link if link.startswith('http') else base + link
+
+def extract_news(html: str, max_news: int, source: NewsSource, fast: bool = NEWS_FAST_PARSE,
+                 fallback: bool = True) -> list:
+    """Разбор страницы источника по его описанию.
+    
+    fallback=False отключает отбор по ссылкам для источников с контейнерами:
+    для недокачанной страницы он может дать не тот результат, что для полной.
+    """
+    news_items = []
+    soup = None
+    fetched_at = time.time()
+    
+    if source.container_plan is not None:
+        soup = make_soup(html, source.strainer, fast)
+        for article in source.container_plan.select(soup, limit=max_news * source.scan_factor):
+            try:
+                title_elem = source.title_plan.select_one(article)
+                if not title_elem:
+                    continue
+                
+                title = title_elem.get_text(strip=True)
+                if len(title) < source.min_title:
+                    continue
+                
+                link_elem = article.find('a', href=True)
+                if link_elem:
+                    link = link_elem['href']
+                elif source.link_attr:
+                    # Пробуем получить ссылку из data-атрибута
+                    link = article.get(source.link_attr, '')
+                else:
+                    continue
+                
+                if not link:
+                    continue
+                
+                news_items.append(NewsItem(title[:source.max_title], _absolute(link, source.base),
+                                           source.name, fetched_at))
+                
+                if len(news_items) >= max_news:
+                    break
+                    
+            except Exception as e:
+                continue
+        
+        if news_items or not fallback:
+            return news_items
+    
+    # Поиск по всем ссылкам страницы
+    if source.links is not None:
+        if soup is None or fast:
+            soup = make_soup(html, link_strainer(), fast)
+        for link in soup.find_all('a', href=True):
+            href = link['href']
+            title = link.get_text(strip=True)
+            if source.links.matches(href, title):
+                news_items.append(NewsItem(title[:source.max_title], _absolute(href, source.base),
+                                           source.name, fetched_at))
+                if len(news_items) >= max_news:
+                    break
+    
+    return news_items
+
+# ===== ПОИСК ДУБЛЕЙ =====
+_WORD = re.compile(r'[a-zа-я0-9]+')
+TITLE_STEM_LENGTH = 5
+_STOP_WORDS = frozenset(
+    'в во на и о об от по с со за к ко из у для не что как это при до после под над '
+    'а но или же ли бы его ее их the of to in a'.split()
+)
+_MINHASH_PRIME = (1 << 61) - 1
+_MINHASH_PERMUTATIONS = [
+    (random.Random(i).randrange(1, _MINHASH_PRIME), random.Random(-i - 1).randrange(0, _MINHASH_PRIME))
+    for i in range(DEDUP_BANDS * DEDUP_ROWS)
+]
+
+def normalize_words(text: str) -> list:
+    """Слова текста в нижнем регистре, ё -> е, без стоп-слов"""
+    return [word for word in _WORD.findall(text.lower().replace('ё', 'е')) if word not in _STOP_WORDS]
+
+def title_tokens(title: str) -> frozenset:
+    """Нормализованные слова заголовка с обрезкой до TITLE_STEM_LENGTH букв
+    вместо стемминга (снимает большинство русских окончаний)"""
+    return frozenset(word[:TITLE_STEM_LENGTH] for word in normalize_words(title))
+
+@functools.lru_cache(maxsize=4096)
+def title_signature(title: str) -> tuple:
+    """Слова заголовка и их MinHash-подпись (кэшируется: одни и те же заголовки приходят из кэша повторно)"""
+    tokens = title_tokens(title)
+    hashes = [zlib.crc32(token.encode()) for token in tokens] or [0]
+    signature = tuple(min((a * h + b) % _MINHASH_PRIME for h in hashes) for a, b in _MINHASH_PERMUTATIONS)
+    return tokens, signature
+
+def dedupe_news(news_items: list) -> list:
+    """Склейка почти одинаковых заголовков разных источников.
+    
+    Кандидаты находятся через LSH по полосам MinHash-подписи, затем проверяются
+    точно: доля общих слов от более короткого заголовка не меньше DEDUP_THRESHOLD.
+    Остается первая новость сюжета, в 'also' - остальные источники с ним.
+    """
+    buckets = {}        # (полоса, значения) -> номера представителей
+    representatives = []  # (новость, слова, источники-дубли)
+    
+    for news in news_items:
+        tokens, signature = title_signature(news.title)
+        bands = [(band, signature[band * DEDUP_ROWS:(band + 1) * DEDUP_ROWS]) for band in range(DEDUP_BANDS)]
+        
+        duplicate_of = None
+        if len(tokens) >= DEDUP_MIN_WORDS:
+            candidates = {index for band in bands for index in buckets.get(band, ())}
+            for index in sorted(candidates):
+                other_tokens = representatives[index][1]
+                shared = len(tokens & other_tokens)
+                if shared >= DEDUP_MIN_WORDS and shared / min(len(tokens), len(other_tokens)) >= DEDUP_THRESHOLD:
+                    duplicate_of = index
+                    break
+        
+        if duplicate_of is None:
+            for band in bands:
+                buckets.setdefault(band, []).append(len(representatives))
+            representatives.append((news, tokens, []))
+        else:
+            also = representatives[duplicate_of][2]
+            if news.source != representatives[duplicate_of][0].source and news.source not in also:
+                also.append(news.source)
+    
+    return [replace(news, also=tuple(also)) if also else news for news, _, also in representatives]
+
+class _LinkProbe(HTMLParser):
+    """Инкрементальный счетчик закрытых ссылок в потоке HTML"""
+    
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.links = 0
+    
+    def handle_endtag(self, tag):
+        if tag == 'a':
+            self.links += 1
+
+class SingleFlight:
+    """Объединение одновременных загрузок: все ожидающие один ключ получают один результат"""
+    
+    def __init__(self):
+        self._flights = {}  # ключ -> (задача, число ожидающих)
+        self.stats = {}     # источник -> счетчики загрузок и обслуженных вызовов
+    
+    async def run(self, key: tuple, fetch):
+        """Запуск fetch() для ключа или присоединение к уже идущей загрузке"""
+        flight = self._flights.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(fetch())
+            flight = self._flights[key] = [task, 0]
+            task.add_done_callback(lambda t: self._finish(key))
+        flight[1] += 1
+        
+        # shield: отмена одного ожидающего не должна отменять общую загрузку
+        return await asyncio.shield(flight[0])
+    
+    def _finish(self, key: tuple):
+        """Учет завершенной загрузки в счетчиках"""
+        _, callers = self._flights.pop(key)
+        stats = self.stats.setdefault(key[0], {'fetches': 0, 'callers': 0, 'max_callers': 0, 'last_callers': 0})
+        stats['fetches'] += 1
+        stats['callers'] += callers
+        stats['max_callers'] = max(stats['max_callers'], callers)
+        stats['last_callers'] = callers
+
+class PageCache:
+    """Дисковый кэш страниц источников: тело, ETag/Last-Modified и разобранные новости.
+    
+    Переживает перезапуск, поэтому после деплоя источники отвечают 304,
+    а новости берутся из уже разобранного результата.
+    """
+    
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._entries = {}  # url -> запись (копия содержимого диска)
+    
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(url.encode()).hexdigest() + '.json')
+    
+    def _read(self, url: str):
+        try:
+            with open(self._path(url), encoding='utf-8') as f:
+                entry = json.load(f)
+            if entry.get('url') != url:
+                return None
+            entry['parsed'] = {max_news: [NewsItem.from_json(news) for news in news_items]
+                               for max_news, news_items in entry.get('parsed', {}).items()}
+            return entry
+        except (OSError, ValueError):
+            return None
+    
+    def _write(self, url: str, entry: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(url)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False, default=NewsItem.to_json)
+        os.replace(tmp_path, path)
+    
+    async def get(self, url: str):
+        """Запись для URL (при первом обращении читается с диска)"""
+        if url not in self._entries:
+            self._entries[url] = await asyncio.to_thread(self._read, url)
+        return self._entries[url]
+    
+    async def put(self, url: str, entry: dict):
+        """Сохранение записи в памяти и на диске"""
+        entry['url'] = url
+        self._entries[url] = entry
+        try:
+            await asyncio.to_thread(self._write, url, entry)
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось сохранить кэш страницы {url}: {e}")
+
+# ===== ЗДОРОВЬЕ ИСТОЧНИКОВ =====
+class CircuitBreaker:
+    """Предохранитель источника с адаптивным таймаутом.
+    
+    closed - запросы идут как обычно. После BREAKER_FAILURES ошибок подряд
+    предохранитель размыкается (open): источник пропускается сразу, без
+    ожидания таймаута. Через cooldown одна пробная загрузка идет в фоне
+    (half_open); удача замыкает предохранитель, ошибка снова размыкает
+    его с удвоенным ожиданием.
+    Таймаут запроса - перцентиль недавних задержек источника с запасом,
+    в пределах от BREAKER_MIN_TIMEOUT до заданного для источника.
+    """
+    
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+    
+    def __init__(self, max_timeout: float):
+        self.max_timeout = max_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.cooldown = BREAKER_COOLDOWN
+        self.retry_at = 0.0
+        self.latencies = deque(maxlen=BREAKER_WINDOW)
+    
+    @property
+    def available(self) -> bool:
+        return self.state == self.CLOSED
+    
+    def probe_due(self, now: float) -> bool:
+        """Пора ли запускать пробную загрузку (переводит в half_open)"""
+        if self.state != self.OPEN or now < self.retry_at:
+            return False
+        self.state = self.HALF_OPEN
+        return True
+    
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.cooldown = BREAKER_COOLDOWN
+    
+    def record_failure(self, now: float) -> bool:
+        """Учет ошибки. True - предохранитель только что разомкнулся"""
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            self.cooldown = min(self.cooldown * 2, BREAKER_MAX_COOLDOWN)
+        elif self.state == self.OPEN or self.failures < BREAKER_FAILURES:
+            return False
+        self.state = self.OPEN
+        self.retry_at = now + self.cooldown
+        return True
+    
+    @property
+    def timeout(self) -> float:
+        """Таймаут по перцентилю задержек (пока замеров мало - заданный для источника)"""
+        if len(self.latencies) < BREAKER_MIN_SAMPLES:
+            return self.max_timeout
+        ordered = sorted(self.latencies)
+        latency = ordered[min(len(ordered) - 1, int(BREAKER_TIMEOUT_PERCENTILE * len(ordered)))]
+        return min(max(latency * BREAKER_TIMEOUT_FACTOR, BREAKER_MIN_TIMEOUT), self.max_timeout)
+
+# ===== ОБЩИЙ КЭШ ДЛЯ НЕСКОЛЬКИХ ВОРКЕРОВ =====
+class BackendError(Exception):
+    """Общий кэш недоступен: воркер продолжает работать сам по себе"""
+
+class SQLiteBackend:
+    """Общий кэш заголовков и блокировки в файле SQLite (воркеры на одной машине)"""
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL);
+        CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL);
+    """
+    
+    def __init__(self, path: str, owner: str = BACKEND_OWNER):
+        self.path = path
+        self.owner = owner  # имя этого воркера в блокировках
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cache-backend')
+        self._conn = None
+    
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=BACKEND_TIMEOUT, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(self.SCHEMA)
+            self._conn = conn
+        return self._conn
+    
+    async def _run(self, func, *args):
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        except sqlite3.Error as e:
+            raise BackendError(str(e)) from e
+    
+    def _get(self, key: str):
+        # fetchall завершает чтение сразу: незакрытое чтение в WAL мешает
+        # следующей записи этого соединения
+        rows = self._connect().execute('SELECT value FROM entries WHERE key = ? AND expires > ?',
+                                       (key, time.time())).fetchall()
+        return json.loads(rows[0][0]) if rows else None
+    
+    def _set(self, key: str, value: str, ttl: float):
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?)', (key, value, time.time() + ttl))
+    
+    def _acquire(self, name: str, ttl: float) -> bool:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('DELETE FROM locks WHERE name = ? AND expires <= ?', (name, now))
+            conn.execute('INSERT OR IGNORE INTO locks VALUES (?, ?, ?)', (name, self.owner, now + ttl))
+            # Своя блокировка продлевается, чужая не трогается
+            return conn.execute('UPDATE locks SET expires = ? WHERE name = ? AND owner = ?',
+                                (now + ttl, name, self.owner)).rowcount == 1
+    
+    def _release(self, name: str):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM locks WHERE name = ? AND owner = ?', (name, self.owner))
+    
+    async def get(self, key: str):
+        return await self._run(self._get, key)
+    
+    async def set(self, key: str, value, ttl: float):
+        await self._run(self._set, key, json.dumps(value, ensure_ascii=False), ttl)
+    
+    async def acquire(self, name: str, ttl: float) -> bool:
+        """Взять или продлить блокировку на ttl секунд"""
+        return await self._run(self._acquire, name, ttl)
+    
+    async def release(self, name: str):
+        await self._run(self._release, name)
+    
+    async def aclose(self):
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+class RedisBackend:
+    """Общий кэш заголовков и блокировки в Redis (воркеры и реплики на разных машинах).
+    
+    Минимальный клиент протокола RESP на asyncio: одно соединение,
+    команды по очереди. Используются только GET, SET с NX/XX/PX и EVAL
+    (снятие блокировки), поэтому подойдет любой сервер с протоколом Redis
+    и Lua-скриптами. TLS (rediss://) не поддерживается.
+    """
+    
+    # Удаление блокировки, только если она все еще наша - одной командой на сервере
+    RELEASE_SCRIPT = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end return 0"
+    
+    def __init__(self, url: str, owner: str = BACKEND_OWNER):
+        self.owner = owner  # имя этого воркера в блокировках
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme != 'redis':
+            raise ValueError(f"Неподдерживаемая схема CACHE_BACKEND_URL: {parts.scheme}:// (нужен redis://)")
+        self.host = parts.hostname or 'localhost'
+        self.port = parts.port or 6379
+        self.password = urllib.parse.unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.lstrip('/') or 0)
+        self.prefix = 'main-news:'
+        self._reader = self._writer = None
+        self._lock = asyncio.Lock()
+    
+    @staticmethod
+    def _encode(args: tuple) -> bytes:
+        chunks = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            chunks.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        return b''.join(chunks)
+    
+    async def _read(self):
+        line = await self._reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("соединение с Redis закрыто")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise BackendError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            size = int(rest)
+            return None if size < 0 else (await self._reader.readexactly(size + 2))[:-2]
+        if kind == b'*':
+            size = int(rest)
+            return None if size < 0 else [await self._read() for _ in range(size)]
+        raise ConnectionError(f"непонятный ответ Redis: {line[:20]!r}")
+    
+    async def _call(self, *args):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                if self.password:
+                    self._writer.write(self._encode(('AUTH', self.password)))
+                    await self._read()
+                if self.db:
+                    self._writer.write(self._encode(('SELECT', self.db)))
+                    await self._read()
+            except BaseException:
+                # Соединение без AUTH/SELECT не годится: следующий вызов подключится заново
+                self._disconnect()
+                raise
+        self._writer.write(self._encode(args))
+        await self._writer.drain()
+        return await self._read()
+    
+    async def command(self, *args):
+        """Выполнение команды; при обрыве или таймауте соединение создается заново"""
+        async with self._lock:
+            try:
+                return await asyncio.wait_for(self._call(*args), BACKEND_TIMEOUT)
+            except BackendError:
+                raise
+            except (OSError, EOFError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                self._disconnect()
+                raise BackendError(f"Redis {self.host}:{self.port}: {e!r}") from e
+    
+    def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+    
+    async def get(self, key: str):
+        value = await self.command('GET', self.prefix + key)
+        return json.loads(value) if value is not None else None
+    
+    async def set(self, key: str, value, ttl: float):
+        await self.command('SET', self.prefix + key, json.dumps(value, ensure_ascii=False), 'PX', int(ttl * 1000))
+    
+    async def acquire(self, name: str, ttl: float) -> bool:
+        """Взять или продлить блокировку на ttl секунд.
+        
+        Проверка владельца и продление - две команды: в редком случае гонки
+        с истечением блокировки сайт просто загрузят два воркера.
+        """
+        key, ttl_ms = self.prefix + 'lock:' + name, int(ttl * 1000)
+        if await self.command('SET', key, self.owner, 'NX', 'PX', ttl_ms) == 'OK':
+            return True
+        if await self.command('GET', key) == self.owner.encode():
+            await self.command('SET', key, self.owner, 'XX', 'PX', ttl_ms)
+            return True
+        return False
+    
+    async def release(self, name: str):
+        await self.command('EVAL', self.RELEASE_SCRIPT, 1, self.prefix + 'lock:' + name, self.owner)
+    
+    async def aclose(self):
+        async with self._lock:
+            self._disconnect()
+
+def make_cache_backend(kind: str, url: str = None):
+    """Общий кэш по имени: memory (только свой процесс, None), sqlite или redis"""
+    if kind == 'sqlite':
+        return SQLiteBackend(url or os.path.join(PAGE_CACHE_DIR, 'shared_cache.db'))
+    if kind == 'redis':
+        return RedisBackend(url or 'redis://localhost:6379/0')
+    if kind != 'memory':
+        raise ValueError(f"Неизвестный CACHE_BACKEND: {kind}")
+    return None
+
+cache_backend = make_cache_backend(CACHE_BACKEND, CACHE_BACKEND_URL)
+
+async def cluster_lock(name: str, ttl: float) -> bool:
+    """Блокировка на весь кластер воркеров; без общего кэша всегда своя"""
+    if cache_backend is None:
+        return True
+    try:
+        return await cache_backend.acquire(name, ttl)
+    except BackendError as e:
+        logger.warning(f"⚠️ Общий кэш недоступен: {e}")
+        return False
+
+def parse_mp_context():
+    """Контекст процессов для пула разбора.
+    
+    max_tasks_per_child несовместим с fork. При spawn каждый пересозданный
+    воркер заново запускает интерпретатор и импортирует бота со всеми
+    зависимостями (~0.9 с). Поэтому используется forkserver: telegram,
+    starlette, httpx, bs4 и lxml импортируются один раз в сервере, воркеры
+    ответвляются от него. Модуль бота, запущенный как скрипт, multiprocessing
+    все равно выполняет в каждом воркере как __mp_main__, но с уже загруженными
+    зависимостями это ~0.1 с на пересоздание, т.е. раз в NEWS_PARSE_MAX_TASKS_PER_CHILD разборов.
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    preload = ['httpx', 'telegram', 'telegram.ext', 'starlette.applications', 'bs4']
+    if HAS_LXML:
+        preload.append('lxml.html')
+    if __name__ != '__main__':
+        # Бот, импортированный по имени (воркеры uvicorn, бенчмарк), тоже загружается заранее
+        preload.append(__name__)
+    context.set_forkserver_preload(preload)
+    return context
 
 class NewsParser:
     """Улучшенный парсер новостей с резервными источниками"""
     
-    def __init__(self):
+    def __init__(self, sources: list = None, cache_ttl: float = NEWS_CACHE_TTL, page_cache_dir: str = PAGE_CACHE_DIR,
+                 fast_parse: bool = NEWS_FAST_PARSE, parse_executor: str = NEWS_PARSE_EXECUTOR,
+                 streaming: bool = NEWS_STREAMING, backend=None):
         self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept-Encoding': ACCEPT_ENCODING,
         }
+        self._client = None
+        self._host_limits = {}  # хост -> семафор параллельных запросов
+        self.page_cache = PageCache(page_cache_dir)
+        self.fast_parse = fast_parse
+        self.parse_executor = parse_executor
+        self.streaming = streaming
+        self.stream_stats = {}  # url -> загрузки, досрочные обрывы, прочитано и сэкономлено байт
+        self._full_sizes = {}   # url -> размер последней полной загрузки
+        self._process_pool = None
+        self.parse_queue = 0      # разборы, отправленные в пул и еще не завершенные
+        self.sources = {source.key: source for source in (sources or SOURCES.values())}
+        self._source_limits = {}  # источник -> семафор его бюджета параллельности
+        self.listeners = []       # вызываются с (источник, новости) после каждой загрузки
+        self.breakers = {key: CircuitBreaker(source.timeout or HTTP_TIMEOUT) for key, source in self.sources.items()}
+        self._probes = {}         # (источник, max_news) -> фоновая пробная загрузка
+        self.backend = backend    # общий кэш кластера (None - только свой процесс)
+        
+        # Кэш заголовков: (источник, max_news) -> (время загрузки, новости)
+        self.cache_ttl = cache_ttl
+        self._cache = {}
+        self._refresh_tasks = {}
+        self._flights = SingleFlight()
         logger.info("🔄 Инициализирован улучшенный парсер новостей")
     
-    def parse_ria_news(self, max_news: int = 5) -> list:
-        """Парсинг новостей с RIA.ru"""
+    async def get_news(self, source: str, max_news: int = 5, max_age: float = None) -> list:
+        """Новости источника из кэша.
+        
+        Свежая запись отдается сразу. Устаревшая тоже отдается сразу,
+        а обновление запускается одной фоновой задачей на ключ.
+        max_age - запись старше стольких секунд не отдается, а загружается
+        заново с ожиданием (для рассылки, которой нужны именно новые заголовки).
+        """
+        key = (source, max_news)
+        entry = self._cache.get(key)
+        if entry is None:
+            metrics.inc('news_cache_requests_total', 'miss')
+            return await self._refresh(key)
+        
+        fetched_at, news_items = entry
+        age = time.monotonic() - fetched_at
+        stale = age > self.cache_ttl
+        metrics.inc('news_cache_requests_total', 'stale' if stale else 'hit')
+        if max_age is not None and age > max_age:
+            return await self._refresh(key)
+        if stale and key not in self._refresh_tasks:
+            task = asyncio.create_task(self._refresh(key))
+            self._refresh_tasks[key] = task
+            task.add_done_callback(lambda t: self._refresh_tasks.pop(key, None))
+        
+        return news_items
+    
+    def peek_news(self, keys: list) -> dict:
+        """Новости из кэша без загрузки и фонового обновления (None - в кэше ничего нет)"""
+        results = {key[0]: self._cache[key][1] for key in keys if key in self._cache}
+        return results or None
+    
+    async def _refresh(self, key: tuple) -> list:
+        """Загрузка источника через общую загрузку для всех ожидающих"""
+        return await self._flights.run(key, lambda: self._load(key))
+    
+    async def _load(self, key: tuple) -> list:
+        """Загрузка источника и запись результата в кэш (через общий кэш, если он есть)"""
+        if self.backend is not None:
+            try:
+                return await self._load_shared(key)
+            except BackendError as e:
+                logger.warning(f"⚠️ Общий кэш недоступен, загружаем сами: {e}")
+        return await self._load_local(key)
+    
+    async def _load_shared(self, key: tuple) -> list:
+        """Загрузка через общий кэш: сайт загружает один воркер кластера.
+        
+        Свежая запись общего кэша берется как есть. Иначе воркер, взявший
+        блокировку источника, загружает сайт и публикует результат, а
+        остальные отдают устаревшую запись или ждут публикации, но не
+        дольше таймаута источника.
+        """
+        name = f"news:{key[0]}:{key[1]}"
+        wait_until = time.monotonic() + self.breakers[key[0]].max_timeout
+        while True:
+            entry = await self.backend.get(name)
+            age = time.time() - entry['fetched_at'] if entry else None
+            if entry and age <= self.cache_ttl:
+                return self._store(key, [NewsItem.from_json(news) for news in entry['news']],
+                                   fetched_at=time.monotonic() - age)
+            if await self.backend.acquire(name, self.breakers[key[0]].max_timeout * 2):
+                break
+            if entry:
+                return self._store(key, [NewsItem.from_json(news) for news in entry['news']],
+                                   fetched_at=time.monotonic() - age)
+            if time.monotonic() >= wait_until:
+                raise BackendError(f"{name}: другой воркер не успел загрузить источник")
+            await asyncio.sleep(BACKEND_POLL_INTERVAL)
+        
         try:
-            url = "https://ria.ru/"
-            response = requests.get(url, headers=self.headers, timeout=15)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            news_items = []
-            
-            # Универсальные селекторы для RIA
-            articles = soup.select('[data-type="article"], .cell-list__item, .list-item, article')[:max_news*2]
+            news_items = await self._fetch(key)
+            if news_items:
+                await self.backend.set(name, {'fetched_at': time.time(), 'news': [news.to_json() for news in news_items]},
+                                       BACKEND_ENTRY_TTL)
+        finally:
+            with contextlib.suppress(BackendError):
+                await self.backend.release(name)
+        return self._store(key, news_items)
+    
+    async def _load_local(self, key: tuple) -> list:
+        """Загрузка источника этим процессом"""
+        return self._store(key, await self._fetch(key))
+    
+    async def _fetch(self, key: tuple) -> list:
+        """Загрузка источника без записи в кэш.
+        
+        Источник с разомкнутым предохранителем не загружается: результат
+        сразу пустой (в кэше остаются прежние новости), а пробная загрузка
+        по истечении паузы идет в фоне.
+        """
+        source, max_news = key
+        if self.breakers[source].available:
+            return await self.parse_source(self.sources[source], max_news)
+        if self.breakers[source].probe_due(time.monotonic()):
+            task = asyncio.create_task(self._probe(key))
+            self._probes[key] = task
+            task.add_done_callback(lambda t: self._probes.pop(key, None))
+        return []
+    
+    async def _probe(self, key: tuple):
+        """Пробная загрузка источника в half_open; удача сразу попадает в кэш"""
+        logger.info(f"🔌 {self.sources[key[0]].name}: пробная загрузка")
+        self._store(key, await self.parse_source(self.sources[key[0]], key[1]))
+    
+    def _store(self, key: tuple, news_items: list, fetched_at: float = None) -> list:
+        """Запись результата загрузки в кэш; возвращает новости, которые стоит показать"""
+        for listener in self.listeners:
+            listener(self.sources[key[0]], news_items)
+        
+        # Запись в кэш идет внутри общей загрузки и случится, даже если все
+        # ожидающие ушли по таймауту. Пустой результат (ошибка, отключенный
+        # источник) не затирает прежние новости и помечает запись устаревшей:
+        # следующий запрос не ждет сайт, а сразу повторяет попытку в фоне
+        if not news_items:
+            entry = self._cache.get(key)
+            news_items = entry[1] if entry else []
+            fetched_at = float('-inf')
+        elif fetched_at is None:
+            fetched_at = time.monotonic()
+        self._cache[key] = (fetched_at, news_items)
+        return news_items
+    
+    async def gather_news(self, keys: list, deadline: float = NEWS_DEADLINE,
+                          hedge: list = None, hedge_delay: float = NEWS_HEDGE_DELAY, on_result=None,
+                          max_age: float = None) -> tuple:
+        """Одновременная загрузка источников категории в пределах общего срока.
+        
+        hedge - резервные источники: запускаются, если основные не ответили
+        за hedge_delay секунд или все вернули пустой результат.
+        on_result(новости по источникам) вызывается после ответа очередного
+        источника, если ждать еще есть кого.
+        max_age - предельный возраст записей кэша (см. get_news).
+        Возвращает (новости по источникам, источники, не успевшие к сроку).
+        Не успевшие загрузки продолжаются в фоне и попадают в кэш.
+        """
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + deadline
+        hedge_at = loop.time() + hedge_delay if hedge else None
+        # Все основные источники недоступны - резервные запускаются сразу
+        if hedge and not self.available(keys):
+            hedge_at = loop.time()
+        
+        tasks = {asyncio.ensure_future(self.get_news(*key, max_age=max_age)): key[0] for key in keys}
+        primary = set(tasks.values())
+        pending = set(tasks)
+        results = {}
+        
+        while pending:
+            now = loop.time()
+            if now >= deadline_at:
+                break
+            wake_at = deadline_at if hedge_at is None else min(deadline_at, hedge_at)
+            done, pending = await asyncio.wait(pending, timeout=wake_at - now,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                results[tasks[task]] = task.result()
             
-            for article in articles:
-                try:
-                    title_elem = article.select_one('.cell-list__item-title, .list-item__title, h2, h3')
-                    if not title_elem:
-                        continue
-                    
-                    title = title_elem.get_text(strip=True)
-                    if len(title) < 10:
-                        continue
-                    
-                    link_elem = article.find('a', href=True)
-                    if link_elem:
-                        link = link_elem['href']
-                        if link and not link.startswith('http'):
-                            link = 'https://ria.ru' + link
-                    else:
+            primary_done = primary.issubset(results)
+            primary_found = any(results.get(source) for source in primary)
+            if primary_done and primary_found:
+                break
+            if hedge_at is not None and (primary_done or loop.time() >= hedge_at):
+                for key in hedge:
+                    task = asyncio.ensure_future(self.get_news(*key, max_age=max_age))
+                    tasks[task] = key[0]
+                    pending.add(task)
+                hedge_at = None
+            if on_result is not None and done and pending:
+                on_result(results)
+        
+        for task in pending:
+            task.cancel()
+        
+        # Резервный источник считаем опоздавшим, только если основные ничего не дали
+        primary_found = any(results.get(source) for source in primary)
+        missed = [tasks[task] for task in pending if tasks[task] in primary or not primary_found]
+        return results, missed
+    
+    def available(self, keys: list) -> bool:
+        """Есть ли среди источников хоть один с замкнутым предохранителем"""
+        return any(self.breakers[key[0]].available for key in keys)
+    
+    @property
+    def flight_stats(self) -> dict:
+        """Сколько загрузок выполнено по каждому источнику и сколько вызовов они обслужили"""
+        return self._flights.stats
+    
+    async def warm_up(self, keys: list):
+        """Предварительное заполнение кэша перед запуском сервера"""
+        results = await asyncio.gather(*(self._refresh(key) for key in keys), return_exceptions=True)
+        loaded = sum(1 for r in results if isinstance(r, list) and r)
+        logger.info(f"🔥 Кэш новостей прогрет: {loaded}/{len(keys)} источников")
+    
+    # ===== ЗАГРУЗКА СТРАНИЦ =====
+    def _get_client(self) -> httpx.AsyncClient:
+        """Общий HTTP-клиент с постоянными соединениями (создается при первом запросе)"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                ),
+                follow_redirects=True,
+                verify=ssl_context(),
+            )
+        return self._client
+    
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        """Семафор параллельных запросов к хосту URL"""
+        host = httpx.URL(url).host
+        semaphore = self._host_limits.get(host)
+        if semaphore is None:
+            semaphore = self._host_limits[host] = asyncio.Semaphore(HTTP_PER_HOST_LIMIT)
+        return semaphore
+    
+    async def _get(self, url: str, headers: dict = None, timeout: float = None) -> httpx.Response:
+        """GET через общий клиент с ограничением параллельности на хост"""
+        async with self._host_limit(url):
+            return await self._get_client().get(url, headers=headers, timeout=timeout or httpx.USE_CLIENT_DEFAULT)
+    
+    async def _stream(self, url: str, headers: dict, timeout: float, extract, max_news: int, label: str) -> tuple:
+        """Потоковая загрузка с досрочным обрывом соединения.
+        
+        Куски страницы по мере прихода скармливаются инкрементальному
+        HTMLParser, который считает закрытые ссылки. Когда ссылок достаточно,
+        полученная часть разбирается с запасом в одну новость: если нашлась
+        max_news + 1-я, контейнеры первых max_news уже закрыты и соединение
+        обрывается. Каждый следующий разбор - не раньше, чем полученная часть
+        вырастет вдвое, поэтому суммарная работа линейна по размеру страницы.
+        Возвращает (ответ, полный HTML или None, новости или None).
+        """
+        async with self._host_limit(url):
+            async with self._get_client().stream('GET', url, headers=headers,
+                                                 timeout=timeout or httpx.USE_CLIENT_DEFAULT) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    return response, None, None
+                
+                probe = _LinkProbe()
+                chunks = []
+                received = checked_at = 0
+                news_items = None
+                async for text in response.aiter_text():
+                    chunks.append(text)
+                    received += len(text)
+                    probe.feed(text)
+                    if probe.links < max_news or received - checked_at < max(NEWS_STREAM_CHECK_CHARS, checked_at):
                         continue
                     
-                    news_items.append({
-                        'title': title[:150],
-                        'link': link,
-                        'source': 'RIA Новости'
-                    })
-                    
-                    if len(news_items) >= max_news:
-                        break
-                        
-                except Exception as e:
-                    continue
-            
-            logger.info(f"✅ RIA: получено {len(news_items)} новостей")
+                    checked_at = received
+                    news_items = await self._run_parse(extract, ''.join(chunks), max_news + 1, label)
+                    if len(news_items) > max_news:
+                        self._record_stream(url, response, early_stop=True)
+                        return response, None, news_items[:max_news]
+                
+                self._record_stream(url, response, early_stop=False)
+                html = ''.join(chunks)
+                # Последний разбор уже видел страницу целиком - второй раз ее не разбираем.
+                # Пустой результат разбирается заново: у полного разбора есть резервные методы
+                if checked_at == received and news_items:
+                    return response, html, news_items[:max_news]
+                return response, html, None
+    
+    def _record_stream(self, url: str, response: httpx.Response, early_stop: bool):
+        """Учет скачанных и сэкономленных байт по источнику"""
+        downloaded = response.num_bytes_downloaded
+        stats = self.stream_stats.setdefault(url, {'fetches': 0, 'early_stops': 0, 'bytes_read': 0, 'bytes_saved': 0})
+        stats['fetches'] += 1
+        stats['bytes_read'] += downloaded
+        if early_stop:
+            # Полный размер берем из Content-Length, иначе из последней полной загрузки
+            full_size = int(response.headers.get('Content-Length') or self._full_sizes.get(url, 0))
+            stats['early_stops'] += 1
+            stats['bytes_saved'] += max(full_size - downloaded, 0)
+        else:
+            self._full_sizes[url] = downloaded
+    
+    async def fetch_news(self, url: str, extract, max_news: int, timeout: float = None,
+                         prefix_extract=None, label: str = None) -> list:
+        """Условная загрузка страницы и разбор новостей.
+        
+        Запрос отправляется с If-None-Match/If-Modified-Since из дискового кэша.
+        На 304 возвращается ранее разобранный результат без повторного разбора.
+        prefix_extract - разбор для недокачанной страницы в потоковом режиме
+        (без резервных методов, которые верны только для страницы целиком).
+        label - имя источника в метриках (по умолчанию URL).
+        """
+        label = label or url
+        entry = await self.page_cache.get(url)
+        headers = {}
+        # После досрочного обрыва тела страницы нет, поэтому условный запрос
+        # имеет смысл, только если есть тело или готовый разбор для max_news
+        if entry and (entry.get('body') is not None or str(max_news) in entry['parsed']):
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        
+        html = news_items = None
+        started = time.monotonic()
+        if self.streaming:
+            response, html, news_items = await self._stream(url, headers, timeout, prefix_extract or extract,
+                                                            max_news, label)
+        else:
+            response = await self._get(url, headers=headers, timeout=timeout)
+        metrics.observe('news_fetch_seconds', time.monotonic() - started, label)
+        
+        if response.status_code == 304 and headers:
+            logger.info(f"♻️ {url}: страница не изменилась")
+            news_items = entry['parsed'].get(str(max_news))
+            if news_items is None:
+                news_items = await self._run_parse(extract, entry['body'], max_news, label)
+                entry['parsed'][str(max_news)] = news_items
+                await self.page_cache.put(url, entry)
             return news_items
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка RIA: {e}")
-            return []
+        
+        response.raise_for_status()
+        if news_items is None:
+            if html is None:
+                html = response.text
+            news_items = await self._run_parse(extract, html, max_news, label)
+        
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            await self.page_cache.put(url, {
+                'etag': etag,
+                'last_modified': last_modified,
+                'body': html,
+                'parsed': {str(max_news): news_items},
+            })
+        return news_items
     
-    def parse_tass_news(self, max_news: int = 5) -> list:
-        """Парсинг новостей с TASS.ru"""
+    def _get_parse_executor(self):
+        """Пул процессов для разбора (None - стандартный пул потоков цикла событий)"""
+        if self.parse_executor != 'process':
+            return None
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=NEWS_PARSE_WORKERS,
+                mp_context=parse_mp_context(),
+                max_tasks_per_child=NEWS_PARSE_MAX_TASKS_PER_CHILD,
+            )
+            logger.info(f"⚙️ Разбор HTML в пуле из {NEWS_PARSE_WORKERS} процессов")
+        return self._process_pool
+    
+    async def _run_parse(self, extract, html: str, max_news: int, label: str = None) -> list:
+        """Разбор HTML вне цикла событий, чтобы не блокировать обработку апдейтов.
+        
+        В режиме процессов в воркер уходит только HTML, обратно - список новостей.
+        """
+        extract = functools.partial(extract, fast=self.fast_parse)
+        executor = self._get_parse_executor()
+        self.parse_queue += 1
+        started = time.monotonic()
         try:
-            url = "https://tass.ru/"
-            response = requests.get(url, headers=self.headers, timeout=15)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            news_items = []
-            
-            articles = soup.select('.news-card, .news-line__item, [data-io-article-url]')[:max_news*2]
-            
-            for article in articles:
-                try:
-                    title_elem = article.select_one('.news-card__title, .news-line__item-title, h3')
-                    if not title_elem:
-                        continue
-                    
-                    title = title_elem.get_text(strip=True)
-                    if len(title) < 10:
-                        continue
-                    
-                    link_elem = article.find('a', href=True)
-                    if link_elem:
-                        link = link_elem['href']
-                        if link and not link.startswith('http'):
-                            link = 'https://tass.ru' + link
-                    else:
-                        # Пробуем получить ссылку из data-атрибута
-                        link = article.get('data-io-article-url', '')
-                        if link and not link.startswith('http'):
-                            link = 'https://tass.ru' + link
-                    
-                    if not link:
-                        continue
-                    
-                    news_items.append({
-                        'title': title[:150],
-                        'link': link,
-                        'source': 'ТАСС'
-                    })
-                    
-                    if len(news_items) >= max_news:
-                        break
-                        
-                except Exception as e:
-                    continue
-            
-            logger.info(f"✅ ТАСС: получено {len(news_items)} новостей")
-            return news_items
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка ТАСС: {e}")
-            return []
+            return await asyncio.get_running_loop().run_in_executor(executor, extract, html, max_news)
+        except BrokenProcessPool:
+            # Упавший воркер ломает весь пул: следующий разбор создаст новый.
+            # Старый пул закрываем, иначе остаются его управляющий поток и живые воркеры
+            if self._process_pool is executor:
+                logger.warning("⚠️ Пул процессов разбора сломан, будет создан заново")
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._process_pool = None
+            raise
+        finally:
+            self.parse_queue -= 1
+            if label:
+                metrics.observe('news_parse_seconds', time.monotonic() - started, label)
+    
+    async def aclose(self):
+        """Закрытие HTTP-соединений и пула процессов разбора"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+        for task in list(self._probes.values()):
+            task.cancel()
     
-    def parse_belpressa_news(self, max_news: int = 5) -> list:
-        """Парсинг новостей Белгорода с Belpressa.ru"""
+    # ===== ИСТОЧНИКИ =====
+    def requests_for(self, category: str, reserve: bool = False) -> list:
+        """Ключи кэша (источник, max_news) для экрана категории"""
+        return [(source.key, source.max_news) for source in self.sources.values()
+                if source.category == category and source.reserve == reserve]
+    
+    async def parse_source(self, source: NewsSource, max_news: int = 5) -> list:
+        """Загрузка и разбор одного источника из реестра"""
+        limit = self._source_limits.get(source.key)
+        if limit is None:
+            limit = self._source_limits[source.key] = asyncio.Semaphore(source.concurrency)
+        breaker = self.breakers[source.key]
+        
         try:
-            url = "https://www.belpressa.ru/news/"
-            response = requests.get(url, headers=self.headers, timeout=15)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            news_items = []
-            
-            # Универсальные селекторы
-            articles = soup.select('.news-item, article, .item, .news-list__item')[:max_news*3]
-            
-            for article in articles:
-                try:
-                    title_elem = article.select_one('h2, h3, .title, .news-title')
-                    if not title_elem:
-                        continue
-                    
-                    title = title_elem.get_text(strip=True)
-                    if len(title) < 15:
-                        continue
-                    
-                    link_elem = article.find('a', href=True)
-                    if link_elem:
-                        link = link_elem['href']
-                        if link and not link.startswith('http'):
-                            link = 'https://www.belpressa.ru' + link
-                    else:
-                        continue
-                    
-                    news_items.append({
-                        'title': title[:200],
-                        'link': link,
-                        'source': 'БелПресса'
-                    })
-                    
-                    if len(news_items) >= max_news:
-                        break
-                        
-                except Exception as e:
-                    continue
-            
-            # Резервный метод поиска
-            if not news_items:
-                all_links = soup.find_all('a', href=True)
-                news_count = 0
-                for link in all_links:
-                    href = link['href']
-                    if '/news/' in href and any(x in href for x in ['2024', '2025']):
-                        title = link.get_text(strip=True)
-                        if title and len(title) > 20:
-                            full_link = href if href.startswith('http') else 'https://www.belpressa.ru' + href
-                            news_items.append({
-                                'title': title[:200],
-                                'link': full_link,
-                                'source': 'БелПресса'
-                            })
-                            news_count += 1
-                            if news_count >= max_news:
-                                break
-            
-            logger.info(f"✅ БелПресса: получено {len(news_items)} новостей")
+            async with limit:
+                started = time.monotonic()
+                news_items = await self.fetch_news(
+                    source.url, functools.partial(extract_news, source=source), max_news,
+                    timeout=breaker.timeout,
+                    prefix_extract=functools.partial(extract_news, source=source, fallback=False),
+                    label=source.key,
+                )
+            breaker.record_success(time.monotonic() - started)
+            metrics.observe('news_items', len(news_items), source.key)
+            logger.info(f"✅ {source.name}: получено {len(news_items)} новостей")
             return news_items
             
         except Exception as e:
-            logger.error(f"❌ Ошибка БелПресса: {e}")
+            logger.error(f"❌ Ошибка {source.name}: {e}")
+            if breaker.record_failure(time.monotonic()):
+                logger.warning(f"🔌 {source.name}: источник отключен, повторная попытка через {breaker.cooldown:.0f} с")
             return []
+
+# Создаем экземпляр парсера
+news_parser = NewsParser(backend=cache_backend)
+
+# ===== ХРАНИЛИЩЕ НОВОСТЕЙ =====
+class ArticleStore:
+    """Все извлеченные новости в SQLite (WAL) и курсоры просмотра чатов.
+    
+    С базой работает один отдельный поток. Новости от парсера копятся
+    в памяти и записываются одной транзакцией за цикл (периодически
+    или перед чтением курсора), поэтому цикл событий базу не ждет.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS articles (
+            link_hash TEXT PRIMARY KEY,
+            link TEXT NOT NULL,
+            title TEXT NOT NULL,
+            source TEXT NOT NULL,
+            category TEXT NOT NULL,
+            first_seen REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS articles_first_seen ON articles (first_seen);
+        CREATE TABLE IF NOT EXISTS chat_cursors (
+            chat_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            seen_at REAL NOT NULL,
+            PRIMARY KEY (chat_id, category)
+        );
+    """
     
-    def parse_belru_news(self, max_news: int = 5) -> list:
-        """Парсинг новостей Белгорода с Bel.ru"""
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='article-store')
+        self._conn = None
+        self._pending = []  # строки articles, ожидающие записи
+        self.stats = {'flushes': 0, 'written': 0, 'purged': 0}
+    
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(self.SCHEMA)
+            self._conn = conn
+        return self._conn
+    
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+    
+    def record(self, source: NewsSource, news_items: list):
+        """Слушатель парсера: новости откладываются до следующей записи пачкой"""
+        now = time.time()
+        self._pending.extend(
+            (news.link_hash, news.link, news.title, news.source, source.category, now)
+            for news in news_items
+        )
+    
+    def _take_pending(self) -> list:
+        rows, self._pending = self._pending, []
+        if rows:
+            self.stats['flushes'] += 1
+            self.stats['written'] += len(rows)
+        return rows
+    
+    def _write(self, conn: sqlite3.Connection, rows: list):
+        # INSERT OR IGNORE сохраняет время первого появления новости
+        conn.executemany('INSERT OR IGNORE INTO articles VALUES (?, ?, ?, ?, ?, ?)', rows)
+    
+    def _flush(self, rows: list):
+        conn = self._connect()
+        with conn:
+            self._write(conn, rows)
+    
+    async def flush(self):
+        """Запись накопленных новостей одной транзакцией"""
+        rows = self._take_pending()
+        if rows:
+            await self._run(self._flush, rows)
+    
+    def _unseen(self, rows: list, chat_id: int, category: str, links: list, now: float) -> set:
+        conn = self._connect()
+        with conn:
+            self._write(conn, rows)
+            cursor = conn.execute('SELECT seen_at FROM chat_cursors WHERE chat_id = ? AND category = ?',
+                                  (chat_id, category)).fetchone()
+            conn.execute('INSERT INTO chat_cursors VALUES (?, ?, ?) '
+                         'ON CONFLICT (chat_id, category) DO UPDATE SET seen_at = excluded.seen_at',
+                         (chat_id, category, now))
+        
+        # При первом просмотре новым считать нечего
+        if cursor is None or not links:
+            return set()
+        hashes = {link_hash(link): link for link in links}
+        found = conn.execute(
+            f'SELECT link_hash FROM articles WHERE first_seen > ? AND link_hash IN ({",".join("?" * len(hashes))})',
+            (cursor[0], *hashes)
+        ).fetchall()
+        return {hashes[row[0]] for row in found}
+    
+    async def unseen(self, chat_id: int, category: str, links: list) -> set:
+        """Ссылки, появившиеся после прошлого просмотра категории чатом. Курсор сдвигается на сейчас"""
         try:
-            url = "https://bel.ru/news/"
-            response = requests.get(url, headers=self.headers, timeout=15)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            news_items = []
-            
-            articles = soup.select('.news-item, article, .item, [class*="news"]')[:max_news*3]
-            
-            for article in articles:
-                try:
-                    title_elem = article.select_one('h1, h2, h3, h4, .title, .news-title')
-                    if not title_elem:
-                        continue
-                    
-                    title = title_elem.get_text(strip=True)
-                    if len(title) < 15:
-                        continue
-                    
-                    link_elem = article.find('a', href=True)
-                    if link_elem:
-                        link = link_elem['href']
-                        if link and not link.startswith('http'):
-                            link = 'https://bel.ru' + link
-                    else:
-                        continue
-                    
-                    news_items.append({
-                        'title': title[:200],
-                        'link': link,
-                        'source': 'Бел.Ру'
-                    })
-                    
-                    if len(news_items) >= max_news:
-                        break
-                        
-                except Exception as e:
-                    continue
-            
-            logger.info(f"✅ Бел.Ру: получено {len(news_items)} новостей")
-            return news_items
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка Бел.Ру: {e}")
+            return await self._run(self._unseen, self._take_pending(), chat_id, category, links, time.time())
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"⚠️ Ошибка хранилища новостей: {e}")
+            return set()
+    
+    def _recent(self, limit: int) -> list:
+        return self._connect().execute('SELECT link, title, source, first_seen FROM articles '
+                                       'ORDER BY first_seen DESC LIMIT ?', (limit,)).fetchall()
+    
+    async def recent(self, limit: int) -> list:
+        """Последние сохраненные новости, от старых к новым"""
+        try:
+            rows = await self._run(self._recent, limit)
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"⚠️ Ошибка хранилища новостей: {e}")
             return []
+        return [NewsItem(title, link, source, first_seen) for link, title, source, first_seen in reversed(rows)]
+    
+    def _purge(self, before: float) -> int:
+        conn = self._connect()
+        with conn:
+            deleted = conn.execute('DELETE FROM articles WHERE first_seen < ?', (before,)).rowcount
+            conn.execute('DELETE FROM chat_cursors WHERE seen_at < ?', (before,))
+        return deleted
     
-    def parse_alternative_belgorod_news(self, max_news: int = 5) -> list:
-        """Резервные источники новостей Белгорода"""
+    async def run(self):
+        """Фоновая запись пачками раз в STORE_FLUSH_INTERVAL и очистка по сроку хранения"""
+        purged_at = 0.0
+        while True:
+            await asyncio.sleep(STORE_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+                if time.time() - purged_at > 3600:
+                    purged_at = time.time()
+                    self.stats['purged'] += await self._run(self._purge, purged_at - STORE_RETENTION_DAYS * 86400)
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"⚠️ Ошибка хранилища новостей: {e}")
+    
+    async def aclose(self):
+        await self.flush()
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+article_store = ArticleStore(ARTICLE_DB)
+news_parser.listeners.append(article_store.record)
+
+# ===== ПОИСК ПО ЗАГОЛОВКАМ =====
+class HeadlineIndex:
+    """Инвертированный индекс заголовков для inline-поиска.
+    
+    Пополняется слушателем парсера при каждой загрузке источника, поиск
+    идет только по индексу. Слова нормализуются так же, как при склейке
+    дублей (title_tokens). Слово запроса короче основы ищется как префикс,
+    чтобы находить заголовки, пока пользователь печатает.
+    Хранит max_items последних новостей, более старые вытесняются.
+    """
+    
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self._docs = {}        # ссылка -> (номер появления, новость, слова)
+        self._postings = {}    # слово -> ссылки новостей
+        self._vocabulary = []  # отсортированные слова для поиска по префиксу
+        self._added = 0
+    
+    def __len__(self) -> int:
+        return len(self._docs)
+    
+    def record(self, source: NewsSource, news_items: list):
+        """Слушатель парсера: новые заголовки добавляются в индекс"""
+        for news in news_items:
+            self.add(news)
+    
+    def add(self, news: NewsItem):
+        link = news.link
+        if link in self._docs:
+            return
+        tokens = title_tokens(news.title)
+        self._added += 1
+        self._docs[link] = (self._added, news, tokens)
+        for token in tokens:
+            links = self._postings.get(token)
+            if links is None:
+                links = self._postings[token] = set()
+                bisect.insort(self._vocabulary, token)
+            links.add(link)
+        if len(self._docs) > self.max_items:
+            self._remove(next(iter(self._docs)))
+    
+    def _remove(self, link: str):
+        _, _, tokens = self._docs.pop(link)
+        for token in tokens:
+            links = self._postings[token]
+            links.discard(link)
+            if not links:
+                del self._postings[token]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+    
+    def _matches(self, word: str) -> set:
+        """Ссылки по слову запроса: точная основа или все основы с таким префиксом"""
+        if len(word) >= TITLE_STEM_LENGTH:
+            return self._postings.get(word[:TITLE_STEM_LENGTH], set())
+        links = set()
+        for token in itertools.islice(self._vocabulary, bisect.bisect_left(self._vocabulary, word), None):
+            if not token.startswith(word):
+                break
+            links |= self._postings[token]
+        return links
+    
+    def search(self, query: str, limit: int) -> list:
+        """Новости, где есть все слова запроса, сначала самые свежие"""
+        words = normalize_words(query)
+        if not words:
+            return [news for _, news, _ in itertools.islice(reversed(self._docs.values()), limit)]
+        
+        matches = sorted((self._matches(word) for word in words), key=len)
+        links = matches[0].intersection(*matches[1:])
+        return [self._docs[link][1] for link in heapq.nlargest(limit, links, key=lambda link: self._docs[link][0])]
+
+headline_index = HeadlineIndex(INDEX_MAX_ITEMS)
+news_parser.listeners.append(headline_index.record)
+
+# ===== ОГРАНИЧЕНИЕ ЧАСТОТЫ ОБНОВЛЕНИЙ =====
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity"""
+    
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class RefreshLimiter:
+    """Лимиты на кнопки обновления новостей: на чат, общий и схлопывание повторов"""
+    
+    def __init__(self):
+        self._global = TokenBucket(RATE_GLOBAL_PER_SEC, RATE_GLOBAL_BURST)
+        self._chats = {}          # чат -> корзина токенов
+        self._last_refresh = {}   # (чат, сообщение, кнопка) -> время последнего обновления
+        self.stats = {'allowed': 0, 'debounced': 0, 'throttled_chat': 0, 'throttled_global': 0, 'served_cached': 0}
+    
+    def check(self, chat_id: int, message_id, data: str) -> str:
+        """Решение по нажатию: allowed, debounced или throttled"""
+        now = time.monotonic()
+        self._prune(now)
+        
+        key = (chat_id, message_id, data)
+        if now - self._last_refresh.get(key, float('-inf')) < REFRESH_DEBOUNCE:
+            self.stats['debounced'] += 1
+            return 'debounced'
+        
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(RATE_CHAT_PER_SEC, RATE_CHAT_BURST)
+        if not bucket.take(now):
+            self.stats['throttled_chat'] += 1
+            return 'throttled'
+        if not self._global.take(now):
+            self.stats['throttled_global'] += 1
+            return 'throttled'
+        
+        self._last_refresh[key] = now
+        self.stats['allowed'] += 1
+        return 'allowed'
+    
+    def _prune(self, now: float):
+        """Удаление давно неактивных чатов, чтобы словари не росли бесконечно"""
+        if len(self._chats) < 10000:
+            return
+        idle = RATE_CHAT_BURST / RATE_CHAT_PER_SEC if RATE_CHAT_PER_SEC else 3600
+        self._chats = {chat: bucket for chat, bucket in self._chats.items() if now - bucket.updated < idle}
+        self._last_refresh = {key: at for key, at in self._last_refresh.items() if now - at < REFRESH_DEBOUNCE}
+
+refresh_limiter = RefreshLimiter()
+
+# ===== ПОДПИСКИ И РАССЫЛКА =====
+CATEGORY_TITLES = {
+    'federal': '🇷🇺 Федеральные новости',
+    'belgorod': '🏙️ Новости Белгорода',
+}
+# Как пользователь может назвать категорию в /subscribe
+CATEGORY_ALIASES = {
+    'federal': 'federal', 'федеральные': 'federal', 'россия': 'federal',
+    'belgorod': 'belgorod', 'белгород': 'belgorod',
+}
+
+def format_news_lines(news_items: list, new_links: set = frozenset(), start: int = 1) -> str:
+    """Нумерованный (с start) список новостей в Markdown, новые с прошлого просмотра помечены 🆕"""
+    return render_news_lines(tuple(news_items), frozenset(new_links), start)
+
+@functools.lru_cache(maxsize=256)
+def render_news_lines(news_items: tuple, new_links: frozenset, start: int = 1) -> str:
+    """Разметка списка новостей, запоминается по содержимому"""
+    message = ""
+    for i, news in enumerate(news_items, start):
+        also = f" (+ {', '.join(news.also)})" if news.also else ""
+        mark = "🆕 " if news.link in new_links else ""
+        message += f"*{i}. {news.source}*{also}\n"
+        message += f"{mark}{news.title}\n"
+        message += f"[Читать]({news.link})\n\n"
+    return message
+
+class Subscriptions:
+    """Подписки чатов на категории, хранятся в JSON-файле"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.chats = self._read()
+        self._lock = asyncio.Lock()  # изменения файла по очереди в пределах процесса
+    
+    def _read(self) -> dict:
+        chats = {category: set() for category in CATEGORY_TITLES}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for category, chat_ids in json.load(f).items():
+                    chats.setdefault(category, set()).update(chat_ids)
+        except (OSError, ValueError):
+            pass
+        return chats
+    
+    async def reload(self):
+        """Перечитывание файла: подписки могли измениться в другом воркере"""
+        self.chats = await asyncio.to_thread(self._read)
+    
+    def _write(self, data: dict):
+        # У каждой записи свой временный файл: одновременные записи не подменяют друг другу .tmp
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, suffix='.tmp', delete=False) as f:
+            json.dump(data, f)
         try:
-            news_items = []
+            os.replace(f.name, self.path)
+        except OSError:
+            os.unlink(f.name)
+            raise
+    
+    def _update(self, change) -> dict:
+        """Чтение, изменение и запись файла под файловой блокировкой (общей для воркеров)"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path + '.lock', 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            chats = self._read()
+            change(chats)
+            self._write({category: sorted(chat_ids) for category, chat_ids in chats.items()})
+        return chats
+    
+    async def _modify(self, change):
+        async with self._lock:
+            try:
+                self.chats = await asyncio.to_thread(self._update, change)
+            except OSError as e:
+                logger.warning(f"⚠️ Не удалось сохранить подписки: {e}")
+                change(self.chats)
+    
+    async def add(self, chat_id: int, category: str):
+        await self._modify(lambda chats: chats[category].add(chat_id))
+    
+    async def remove(self, chat_id: int, categories: list = None):
+        def change(chats: dict):
+            for category in categories or list(chats):
+                chats[category].discard(chat_id)
+        await self._modify(change)
+
+class DigestJob:
+    """Фоновый опрос источников и рассылка новых заголовков подписчикам.
+    
+    Отправка идет пачками с общим темпом не выше BROADCAST_RATE сообщений
+    в секунду и не чаще раза в BROADCAST_CHAT_INTERVAL секунд в один чат.
+    RetryAfter приостанавливает всю рассылку на указанное Telegram время.
+    """
+    
+    def __init__(self, parser: NewsParser, subscriptions: Subscriptions):
+        self.parser = parser
+        self.subscriptions = subscriptions
+        self._seen = {}  # категория -> ссылки прошлого опроса, уже известные подписчикам
+        self._bucket = TokenBucket(BROADCAST_RATE, BROADCAST_RATE)
+        self._pause_until = 0.0
+        self._last_sent = {}  # чат -> время последней отправки
+        self.stats = {'polls': 0, 'sent': 0, 'failed': 0, 'retry_after': 0, 'unsubscribed': 0}
+    
+    async def run(self, bot):
+        """Бесконечный цикл опроса с интервалом DIGEST_INTERVAL.
+        
+        При нескольких воркерах рассылает только владелец блокировки digest.
+        """
+        while True:
+            try:
+                if await cluster_lock('digest', DIGEST_INTERVAL * 2):
+                    await self.poll_once(bot)
+            except Exception as e:
+                logger.error(f"❌ Ошибка рассылки: {e}")
+            await asyncio.sleep(DIGEST_INTERVAL)
+    
+    async def poll_once(self, bot):
+        """Один цикл: новые заголовки по категориям с подписчиками"""
+        self.stats['polls'] += 1
+        await self.subscriptions.reload()
+        for category, chat_ids in self.subscriptions.chats.items():
+            if not chat_ids:
+                continue
             
-            # Альтернативный источник - региональные новости
-            alternative_sources = [
-                {
-                    'url': 'https://www.belnovosti.ru/',
-                    'source': 'БелНовости',
-                    'base': 'https://www.belnovosti.ru'
-                }
-            ]
+            sources = self.parser.requests_for(category)
+            reserve = self.parser.requests_for(category, reserve=True)
+            # Устаревший кэш не годится: рассылка отправила бы то, что загрузил прошлый опрос
+            results, _ = await self.parser.gather_news(sources, hedge=reserve or None, max_age=self.parser.cache_ttl)
+            news_items = [news for key, _ in sources + reserve for news in results.get(key, [])]
             
-            for source in alternative_sources:
-                try:
-                    response = requests.get(source['url'], headers=self.headers, timeout=10)
-                    soup = BeautifulSoup(response.text, 'html.parser')
-                    
-                    # Ищем новости по ключевым словам
-                    all_links = soup.find_all('a', href=True)
-                    for link in all_links:
-                        href = link['href']
-                        title = link.get_text(strip=True)
-                        
-                        if (title and len(title) > 20 and 
-                            any(word in title.lower() for word in ['белгород', 'област', 'город', 'новост'])):
-                            
-                            full_link = href if href.startswith('http') else source['base'] + href
-                            news_items.append({
-                                'title': title[:150],
-                                'link': full_link,
-                                'source': source['source']
-                            })
-                            
-                            if len(news_items) >= max_news:
-                                break
-                                
-                except Exception as e:
-                    logger.warning(f"⚠️ Ошибка альтернативного источника {source['source']}: {e}")
-                    continue
-            
-            return news_items
+            seen = self._seen.get(category)
+            fresh = dedupe_news([news for news in news_items if seen is not None and news.link not in seen])
+            # Помним только ссылки последнего опроса, иначе набор растет все время работы процесса
+            self._seen[category] = {news.link for news in news_items}
             
-        except Exception as e:
-            logger.error(f"❌ Ошибка альтернативных источников: {e}")
-            return []
+            # Первый опрос только запоминает текущие новости, чтобы не слать старое
+            if fresh:
+                text = f"🆕 *{CATEGORY_TITLES[category]}*\n\n" + format_news_lines(fresh[:DIGEST_MAX_NEWS])
+                await self.broadcast(bot, sorted(chat_ids), text)
+    
+    async def broadcast(self, bot, chat_ids: list, text: str):
+        """Рассылка одного сообщения списку чатов пачками"""
+        for i in range(0, len(chat_ids), BROADCAST_BATCH):
+            batch = chat_ids[i:i + BROADCAST_BATCH]
+            await asyncio.gather(*(self._send(bot, chat_id, text) for chat_id in batch))
+        logger.info(f"📬 Рассылка: {len(chat_ids)} чатов")
+    
+    async def _wait_slot(self, chat_id: int):
+        """Ожидание, пока отправка в чат уложится в общий и личный лимиты"""
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            wait = max(self._pause_until - now,
+                       self._last_sent.get(chat_id, float('-inf')) + BROADCAST_CHAT_INTERVAL - now)
+            if wait <= 0 and self._bucket.take(time.monotonic()):
+                self._last_sent[chat_id] = now
+                return
+            await asyncio.sleep(max(wait, 1 / BROADCAST_RATE))
+    
+    async def _send(self, bot, chat_id: int, text: str):
+        for attempt in range(BROADCAST_RETRIES + 1):
+            await self._wait_slot(chat_id)
+            try:
+                await bot.send_message(chat_id, text, parse_mode='Markdown', disable_web_page_preview=True)
+                self.stats['sent'] += 1
+                return
+            except RetryAfter as e:
+                # Флуд-контроль Telegram общий для бота: ставим на паузу всю рассылку
+                self.stats['retry_after'] += 1
+                self._pause_until = asyncio.get_running_loop().time() + e.retry_after
+            except Forbidden:
+                # Бот заблокирован пользователем - подписка больше не нужна
+                self.stats['unsubscribed'] += 1
+                await self.subscriptions.remove(chat_id)
+                return
+            except BadRequest as e:
+                logger.warning(f"⚠️ Не удалось отправить рассылку в чат {chat_id}: {e}")
+                break
+            except NetworkError:
+                # Сетевые сбои и таймауты повторяем с растущей паузой
+                await asyncio.sleep(2 ** attempt)
+            except TelegramError as e:
+                logger.warning(f"⚠️ Не удалось отправить рассылку в чат {chat_id}: {e}")
+                break
+        self.stats['failed'] += 1
 
-# Создаем экземпляр парсера
-news_parser = NewsParser()
+subscriptions = Subscriptions(SUBSCRIPTIONS_FILE)
+digest_job = DigestJob(news_parser, subscriptions)
+
+# ===== КЛАВИАТУРЫ И ПРАВКА СООБЩЕНИЙ =====
+@functools.lru_cache(maxsize=64)
+def keyboard(*rows: tuple) -> InlineKeyboardMarkup:
+    """Клавиатура из рядов кнопок (текст, callback_data); один объект на каждый набор кнопок"""
+    return InlineKeyboardMarkup([[InlineKeyboardButton(text, callback_data=data) for text, data in row]
+                                 for row in rows])
+
+BUTTON_FEDERAL = ("🇷🇺 Федеральные новости", "federal_news")
+BUTTON_BELGOROD = ("🏙️ Новости Белгорода", "belgorod_news")
+BUTTON_MENU = ("🏠 Главное меню", "refresh_news")
+BUTTON_REFRESH = ("🔄 Обновить", "refresh_news")
+BUTTON_HELP = ("ℹ️ Помощь", "help")
+
+MAIN_KEYBOARD = keyboard((BUTTON_FEDERAL,), (BUTTON_BELGOROD,), (BUTTON_REFRESH, BUTTON_HELP))
+CATEGORIES_KEYBOARD = keyboard((BUTTON_FEDERAL,), (BUTTON_BELGOROD,))
+HELP_KEYBOARD = keyboard((BUTTON_FEDERAL,), (BUTTON_BELGOROD,), (BUTTON_MENU,))
+MENU_KEYBOARD = keyboard((BUTTON_MENU,))
+CATEGORY_ROWS = {
+    'federal': ((("🔄 Обновить", "federal_news"),), (BUTTON_BELGOROD,), (BUTTON_MENU,)),
+    'belgorod': ((("🔄 Обновить", "belgorod_news"),), (BUTTON_FEDERAL,), (BUTTON_MENU,)),
+}
+FEDERAL_KEYBOARD = keyboard(*CATEGORY_ROWS['federal'])
+BELGOROD_KEYBOARD = keyboard(*CATEGORY_ROWS['belgorod'])
+
+def news_keyboard(category: str, news_items: list, end: int) -> InlineKeyboardMarkup:
+    """Клавиатура экрана категории; "Далее ▶", если в буфере есть новости после end.
+    
+    Курсор страницы в callback_data - хэш ссылки последней показанной новости.
+    """
+    rows = CATEGORY_ROWS[category]
+    if end < len(news_items):
+        rows = ((("Далее ▶", f"page:{category}:{news_items[end - 1].link_hash}"),),) + rows
+    return keyboard(*rows)
+
+class ShownMessages:
+    """Отпечатки содержимого, последним показанного в сообщениях с кнопками.
+    
+    Правка с тем же текстом и клавиатурой до Telegram не доходит.
+    Хранятся последние max_size сообщений.
+    """
+    
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._digests = {}  # сообщение -> hash(текст, клавиатура), в порядке последней правки
+        self.stats = {'edits': 0, 'skipped': 0, 'not_modified': 0}
+    
+    @staticmethod
+    def message_key(query):
+        if query.message:
+            return query.message.chat.id, query.message.message_id
+        return query.inline_message_id
+    
+    def is_shown(self, key, digest: int) -> bool:
+        return self._digests.get(key) == digest
+    
+    def remember(self, key, digest: int):
+        self._digests.pop(key, None)
+        self._digests[key] = digest
+        if len(self._digests) > self.max_size:
+            del self._digests[next(iter(self._digests))]
+
+shown_messages = ShownMessages()
+
+MAIN_MENU_TEXT = (
+    "📰 *Главное меню*\n\n"
+    "Выберите категорию новостей:"
+)
+
+HELP_TEXT = (
+    "ℹ️ *Помощь по боту*\n\n"
+    "*Источники новостей:*\n"
+    "• RIA Новости - федеральные\n"
+    "• ТАСС - федеральные\n"
+    "• БелПресса - Белгород\n" 
+    "• Бел.Ру - Белгород\n\n"
+    "*Как использовать:*\n"
+    "1. Выберите категорию новостей\n"
+    "2. Нажмите на ссылку для чтения\n"
+    "3. Используйте '🔄 Обновить' для актуальных новостей\n"
+    "4. Для поиска наберите в любом чате имя бота и слова из заголовка\n\n"
+    "📞 *Поддержка:* @Alex_De_White"
+)
+
+async def edit_message(query, text: str, reply_markup: InlineKeyboardMarkup = None, **kwargs) -> bool:
+    """Правка сообщения кнопки, если его содержимое изменилось.
+    
+    Возвращает False, если правка не понадобилась.
+    """
+    key = shown_messages.message_key(query)
+    digest = hash((text, reply_markup))
+    if shown_messages.is_shown(key, digest):
+        shown_messages.stats['skipped'] += 1
+        return False
+    
+    try:
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown', **kwargs)
+        shown_messages.stats['edits'] += 1
+    except BadRequest as e:
+        # Сообщение уже такое (например, показано до перезапуска бота)
+        if 'not modified' not in str(e).lower():
+            raise
+        shown_messages.stats['not_modified'] += 1
+    shown_messages.remember(key, digest)
+    return True
+
+class ProgressiveEditor:
+    """Промежуточные правки сообщения, пока идет загрузка.
+    
+    Правки схлопываются: между ними проходит не меньше NEWS_EDIT_INTERVAL,
+    а из накопившихся за это время версий показывается последняя.
+    """
+    
+    def __init__(self, query):
+        self.query = query
+        self.shown = False     # была ли хоть одна промежуточная правка
+        self._pending = None   # (текст, клавиатура), ожидающие показа
+        self._shown_at = float('-inf')
+        self._editing = False
+        self._closed = False
+        self._task = None
+    
+    def show(self, text: str, reply_markup: InlineKeyboardMarkup = None):
+        """Поставить версию сообщения в очередь показа"""
+        if self._closed:
+            return
+        self._pending = (text, reply_markup)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self._pending is not None and not self._closed:
+            delay = self._shown_at + NEWS_EDIT_INTERVAL - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            text, reply_markup = self._pending
+            self._pending = None
+            self._shown_at = loop.time()
+            self._editing = True
+            try:
+                await edit_message(self.query, text, reply_markup)
+                self.shown = True
+            except TelegramError as e:
+                logger.warning(f"⚠️ Промежуточная правка не удалась: {e}")
+            finally:
+                self._editing = False
+    
+    async def close(self):
+        """Остановка перед финальной правкой: начатая правка дожидается, отложенная отменяется"""
+        self._closed = True
+        if self._task is not None and not self._task.done():
+            if self._editing:
+                await self._task
+            else:
+                self._task.cancel()
+
+async def load_progressively(query, load, render_partial, placeholder: str):
+    """Загрузка новостей с показом промежуточного результата.
+    
+    load(on_result) - загрузка, вызывающая on_result(результаты) по мере
+    ответа источников. Если за NEWS_PLACEHOLDER_DELAY ничего не пришло,
+    показывается заглушка; дальше (при NEWS_PROGRESSIVE) сообщение
+    показывает уже полученные новости (render_partial -> текст, клавиатура).
+    """
+    editor = ProgressiveEditor(query)
+    timer = asyncio.get_running_loop().call_later(NEWS_PLACEHOLDER_DELAY, editor.show, placeholder)
+    
+    def on_result(results: dict):
+        if NEWS_PROGRESSIVE and any(results.values()):
+            timer.cancel()
+            editor.show(*render_partial(results))
+    
+    try:
+        return await load(on_result)
+    finally:
+        timer.cancel()
+        await editor.close()
 
 # ===== ОБРАБОТЧИКИ КОМАНД ТЕЛЕГРАМ =====
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка команды /start"""
-    keyboard = [
-        [InlineKeyboardButton("🇷🇺 Федеральные новости", callback_data="federal_news")],
-        [InlineKeyboardButton("🏙️ Новости Белгорода", callback_data="belgorod_news")],
-        [InlineKeyboardButton("🔄 Обновить", callback_data="refresh_news"),
-         InlineKeyboardButton("ℹ️ Помощь", callback_data="help")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     user = update.effective_user
     welcome_text = (
         f"👋 Привет, {user.first_name}!\n\n"
@@ -332,7 +2256,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text(
         welcome_text,
-        reply_markup=reply_markup,
+        reply_markup=MAIN_KEYBOARD,
         parse_mode='Markdown'
     )
 
@@ -343,7 +2267,10 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "*Основные команды:*\n"
         "/start - начать работу\n"
         "/news - получить новости\n"
+        "/subscribe - подписаться на новые заголовки\n"
+        "/unsubscribe - отменить подписку\n"
         "/help - эта справка\n\n"
+        "🔎 *Поиск:* наберите в любом чате имя бота и слова из заголовка\n\n"
         "*Источники новостей:*\n"
         "• RIA Новости - федеральные\n"
         "• ТАСС - федеральные\n" 
@@ -352,36 +2279,101 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "📞 *Поддержка:* @Alex_De_White"
     )
     
-    keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data="refresh_news")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await update.message.reply_text(
         help_text,
-        reply_markup=reply_markup,
+        reply_markup=MENU_KEYBOARD,
         parse_mode='Markdown'
     )
 
 async def news_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка команды /news"""
-    keyboard = [
-        [InlineKeyboardButton("🇷🇺 Федеральные новости", callback_data="federal_news")],
-        [InlineKeyboardButton("🏙️ Новости Белгорода", callback_data="belgorod_news")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await update.message.reply_text(
         "📰 Выберите категорию новостей:",
-        reply_markup=reply_markup
+        reply_markup=CATEGORIES_KEYBOARD
+    )
+
+async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработка команды /subscribe <категория>"""
+    category = CATEGORY_ALIASES.get(context.args[0].lower()) if context.args else None
+    if category is None:
+        await update.message.reply_text(
+            "📬 *Подписка на новые заголовки*\n\n"
+            "/subscribe federal - федеральные новости\n"
+            "/subscribe belgorod - новости Белгорода\n"
+            "/unsubscribe - отписаться от всего",
+            parse_mode='Markdown'
+        )
+        return
+    
+    await subscriptions.add(update.effective_chat.id, category)
+    await update.message.reply_text(
+        f"✅ Вы подписаны: {CATEGORY_TITLES[category]}\n"
+        "Новые заголовки будут приходить автоматически."
     )
 
+async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработка команды /unsubscribe [категория]"""
+    category = CATEGORY_ALIASES.get(context.args[0].lower()) if context.args else None
+    if context.args and category is None:
+        await update.message.reply_text(
+            "🔕 *Отмена подписки*\n\n"
+            "/unsubscribe federal - федеральные новости\n"
+            "/unsubscribe belgorod - новости Белгорода\n"
+            "/unsubscribe - отписаться от всего",
+            parse_mode='Markdown'
+        )
+        return
+    await subscriptions.remove(update.effective_chat.id, [category] if category else None)
+    await update.message.reply_text("🔕 Подписка отменена")
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inline-поиск заголовков: @бот белгород дорога"""
+    query = update.inline_query
+    results = [
+        InlineQueryResultArticle(
+            id=news.link_hash,
+            title=news.title,
+            description=news.source,
+            url=news.link,
+            input_message_content=InputTextMessageContent(f"{news.title}\n{news.source}: {news.link}"),
+        )
+        for news in headline_index.search(query.query, INLINE_MAX_RESULTS)
+    ]
+    await query.answer(results, cache_time=INLINE_CACHE_TIME)
+
 # ===== ОБРАБОТЧИК КНОПОК =====
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка нажатий на кнопки"""
     query = update.callback_query
-    await query.answer()
-    
     data = query.data
     
+    # Кнопки новостей запускают загрузку сайтов, поэтому ограничены по частоте
+    senders = {"federal_news": send_federal_news, "belgorod_news": send_belgorod_news}
+    if data in senders:
+        message_id = query.message.message_id if query.message else query.inline_message_id
+        verdict = refresh_limiter.check(query_chat_id(query), message_id, data)
+        
+        if verdict == 'debounced':
+            await query.answer("⏳ Новости только что обновлены")
+            return
+        if verdict == 'throttled':
+            if await senders[data](query, cached_only=True):
+                refresh_limiter.stats['served_cached'] += 1
+                await query.answer("⏳ Слишком часто: показаны сохраненные новости")
+            else:
+                await query.answer("⏳ Слишком много запросов, попробуйте через несколько секунд")
+            return
+    
+    if data.startswith("page:"):
+        _, category, cursor = data.split(":", 2)
+        if await send_news_page(query, category, cursor):
+            await query.answer()
+        else:
+            await query.answer("⌛ Список новостей обновился, откройте категорию заново")
+        return
+    
+    await query.answer()
+    
     if data == "federal_news":
         await send_federal_news(query)
     elif data == "belgorod_news":
@@ -391,15 +2383,70 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif data == "help":
         await show_help(query)
 
-async def send_federal_news(query):
-    """Отправка федеральных новостей"""
-    await query.edit_message_text("📡 *Загружаю федеральные новости...*", parse_mode='Markdown')
+def query_chat_id(query) -> int:
+    """Чат, в котором нажата кнопка (для inline-сообщений - пользователь)"""
+    return query.message.chat.id if query.message else query.from_user.id
+
+def format_new_count(new_links: set) -> str:
+    return f"🆕 *Новых с прошлого просмотра:* {len(new_links)}\n\n" if new_links else ""
+
+def select_news_page(news_items: list, new_links: set) -> tuple:
+    """Первая страница экрана категории и позиция в буфере, с которой продолжит "Далее ▶".
     
-    # Парсим новости асинхронно
-    ria_news = await asyncio.get_event_loop().run_in_executor(None, news_parser.parse_ria_news, 4)
-    tass_news = await asyncio.get_event_loop().run_in_executor(None, news_parser.parse_tass_news, 4)
+    Если с прошлого просмотра появились новости, показываются только они,
+    иначе - начало всего списка.
+    """
+    fresh = [news for news in news_items if news.link in new_links][:NEWS_PAGE_SIZE]
+    if not fresh:
+        return news_items[:NEWS_PAGE_SIZE], min(NEWS_PAGE_SIZE, len(news_items))
+    return fresh, news_items.index(fresh[-1]) + 1
+
+NEWS_HEADERS = {
+    'federal': "🇷🇺 *ФЕДЕРАЛЬНЫЕ НОВОСТИ*",
+    'belgorod': "🏙️ *НОВОСТИ БЕЛГОРОДА И ОБЛАСТИ*",
+}
+
+def format_partial(header: str, news_items: list, waiting: list) -> str:
+    """Промежуточное сообщение: уже полученные новости и источники, которых еще ждем"""
+    names = ", ".join(news_parser.sources[key].name for key in waiting)
+    return f"{header}\n\n" + format_news_lines(news_items[:NEWS_PAGE_SIZE]) + (f"⏳ *Загружаются:* {names}\n" if names else "")
+
+def format_missed_sources(missed: list, keys: list = ()) -> str:
+    """Пометка источников, не успевших ответить к сроку, и отключенных предохранителем"""
+    message = ""
+    if missed:
+        names = ", ".join(news_parser.sources[source].name for source in missed)
+        message += f"⏱ *Не успели ответить:* {names}\n"
+    down = [news_parser.sources[key].name for key, _ in keys if not news_parser.breakers[key].available]
+    if down:
+        message += f"🔌 *Временно недоступны:* {', '.join(down)}\n"
+    return message
+
+async def send_federal_news(query, cached_only: bool = False) -> bool:
+    """Отправка федеральных новостей.
+    
+    cached_only - показать только то, что уже есть в кэше, без загрузки.
+    Возвращает False, если показывать нечего.
+    """
+    sources = news_parser.requests_for('federal')
+    if cached_only:
+        results, missed = news_parser.peek_news(sources), []
+        if results is None:
+            return False
+    else:
+        def render_partial(results: dict) -> tuple:
+            news_items = dedupe_news([news for key, _ in sources for news in results.get(key, [])])
+            waiting = [key for key, _ in sources if key not in results]
+            return format_partial(NEWS_HEADERS['federal'], news_items, waiting), FEDERAL_KEYBOARD
+        
+        # Опрашиваем все источники одновременно в пределах общего срока,
+        # уже полученные новости показываются, не дожидаясь остальных
+        results, missed = await load_progressively(
+            query, lambda on_result: news_parser.gather_news(sources, on_result=on_result),
+            render_partial, "📡 *Загружаю федеральные новости...*")
     
-    all_news = ria_news + tass_news
+    all_news = dedupe_news([news for key, _ in sources for news in results.get(key, [])])
+    end = 0  # позиция "Далее ▶" в буфере
     
     if not all_news:
         message = (
@@ -410,41 +2457,54 @@ async def send_federal_news(query):
             "• Написать в поддержку @Alex_De_White"
         )
     else:
-        message = "🇷🇺 *ФЕДЕРАЛЬНЫЕ НОВОСТИ*\n\n"
-        for i, news in enumerate(all_news[:6], 1):
-            message += f"*{i}. {news['source']}*\n"
-            message += f"{news['title']}\n"
-            message += f"[Читать]({news['link']})\n\n"
-    
-    keyboard = [
-        [InlineKeyboardButton("🔄 Обновить", callback_data="federal_news")],
-        [InlineKeyboardButton("🏙️ Новости Белгорода", callback_data="belgorod_news")],
-        [InlineKeyboardButton("🏠 Главное меню", callback_data="refresh_news")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+        new_links = await article_store.unseen(query_chat_id(query), 'federal', [news.link for news in all_news])
+        page, end = select_news_page(all_news, new_links)
+        message = f"{NEWS_HEADERS['federal']}\n\n" + format_new_count(new_links)
+        message += format_news_lines(page, new_links)
+        message += format_missed_sources(missed, sources)
     
-    await query.edit_message_text(
-        message,
-        reply_markup=reply_markup,
-        parse_mode='Markdown',
-        disable_web_page_preview=False
-    )
+    await edit_message(query, message, news_keyboard('federal', all_news, end),
+                       disable_web_page_preview=False)
+    return True
 
-async def send_belgorod_news(query):
-    """Отправка новостей Белгорода с резервными источниками"""
-    await query.edit_message_text("📡 *Загружаю новости Белгорода...*", parse_mode='Markdown')
+def select_belgorod_news(results: dict, sources: list, reserve: list) -> tuple:
+    """Новости Белгорода для показа и признак, что они из резервных источников.
     
-    # Парсим основные источники
-    belpressa_news = await asyncio.get_event_loop().run_in_executor(None, news_parser.parse_belpressa_news, 3)
-    belru_news = await asyncio.get_event_loop().run_in_executor(None, news_parser.parse_belru_news, 3)
+    Резервные источники используются, если основные отключены
+    предохранителями или не дали результатов.
+    """
+    primary_news = dedupe_news([news for key, _ in sources for news in results.get(key, [])])
+    reserve_news = []
+    if not primary_news or not news_parser.available(sources):
+        reserve_news = dedupe_news([news for key, _ in reserve for news in results.get(key, [])])
+    return reserve_news or primary_news, bool(reserve_news)
+
+async def send_belgorod_news(query, cached_only: bool = False) -> bool:
+    """Отправка новостей Белгорода с резервными источниками.
     
-    all_news = belpressa_news + belru_news
+    cached_only - показать только то, что уже есть в кэше, без загрузки.
+    Возвращает False, если показывать нечего.
+    """
+    sources = news_parser.requests_for('belgorod')
+    reserve = news_parser.requests_for('belgorod', reserve=True)
+    if cached_only:
+        results, missed = news_parser.peek_news(sources + reserve), []
+        if results is None:
+            return False
+    else:
+        def render_partial(results: dict) -> tuple:
+            news_items, _ = select_belgorod_news(results, sources, reserve)
+            waiting = [key for key, _ in sources if key not in results]
+            return format_partial(NEWS_HEADERS['belgorod'], news_items, waiting), BELGOROD_KEYBOARD
+        
+        # Опрашиваем основные источники одновременно, резервные запускаются,
+        # если основные медлят или ничего не нашли
+        results, missed = await load_progressively(
+            query, lambda on_result: news_parser.gather_news(sources, hedge=reserve, on_result=on_result),
+            render_partial, "📡 *Загружаю новости Белгорода...*")
     
-    # Если основные источники не дали результатов, используем резервные
-    if not all_news:
-        await query.edit_message_text("📡 *Ищу альтернативные источники...*", parse_mode='Markdown')
-        alternative_news = await asyncio.get_event_loop().run_in_executor(None, news_parser.parse_alternative_belgorod_news, 6)
-        all_news = alternative_news
+    all_news, reserve_news = select_belgorod_news(results, sources, reserve)
+    end = 0  # позиция "Далее ▶" в буфере
     
     if not all_news:
         message = (
@@ -456,91 +2516,127 @@ async def send_belgorod_news(query):
             "Попробуйте позже или проверьте федеральные новости 🇷🇺"
         )
     else:
-        message = "🏙️ *НОВОСТИ БЕЛГОРОДА И ОБЛАСТИ*\n\n"
-        for i, news in enumerate(all_news[:6], 1):
-            message += f"*{i}. {news['source']}*\n"
-            message += f"{news['title']}\n"
-            message += f"[Читать]({news['link']})\n\n"
+        new_links = await article_store.unseen(query_chat_id(query), 'belgorod', [news.link for news in all_news])
+        page, end = select_news_page(all_news, new_links)
+        message = f"{NEWS_HEADERS['belgorod']}\n\n" + format_new_count(new_links)
+        message += format_news_lines(page, new_links)
         
-        if not belpressa_news and not belru_news:
+        if reserve_news:
             message += "⚠️ *Используются альтернативные источники*\n"
+        message += format_missed_sources(missed, sources)
     
-    keyboard = [
-        [InlineKeyboardButton("🔄 Обновить", callback_data="belgorod_news")],
-        [InlineKeyboardButton("🇷🇺 Федеральные новости", callback_data="federal_news")],
-        [InlineKeyboardButton("🏠 Главное меню", callback_data="refresh_news")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    await edit_message(query, message, news_keyboard('belgorod', all_news, end),
+                       disable_web_page_preview=False)
+    return True
+
+def category_news(category: str, results: dict) -> list:
+    """Буфер новостей экрана категории в порядке показа"""
+    sources = news_parser.requests_for(category)
+    if category == 'belgorod':
+        return select_belgorod_news(results, sources, news_parser.requests_for(category, reserve=True))[0]
+    return dedupe_news([news for key, _ in sources for news in results.get(key, [])])
+
+async def send_news_page(query, category: str, cursor: str) -> bool:
+    """Следующая страница новостей категории после новости с хэшем ссылки cursor.
     
-    await query.edit_message_text(
-        message,
-        reply_markup=reply_markup,
-        parse_mode='Markdown',
-        disable_web_page_preview=False
-    )
+    Страница берется из кэша парсера, сайты не загружаются. Возвращает
+    False, если в кэше нет новости cursor (список уже обновился).
+    """
+    if category not in NEWS_HEADERS:
+        return False
+    keys = news_parser.requests_for(category) + news_parser.requests_for(category, reserve=True)
+    all_news = category_news(category, news_parser.peek_news(keys) or {})
+    start = next((i + 1 for i, news in enumerate(all_news) if news.link_hash == cursor), len(all_news))
+    if start >= len(all_news):
+        return False
+    
+    end = min(start + NEWS_PAGE_SIZE, len(all_news))
+    message = f"{NEWS_HEADERS[category]}\n\n📄 *Новости {start + 1}–{end} из {len(all_news)}*\n\n"
+    message += format_news_lines(all_news[start:end], start=start + 1)
+    await edit_message(query, message, news_keyboard(category, all_news, end), disable_web_page_preview=False)
+    return True
 
 async def refresh_news_menu(query):
     """Обновление главного меню"""
-    keyboard = [
-        [InlineKeyboardButton("🇷🇺 Федеральные новости", callback_data="federal_news")],
-        [InlineKeyboardButton("🏙️ Новости Белгорода", callback_data="belgorod_news")],
-        [InlineKeyboardButton("🔄 Обновить", callback_data="refresh_news"),
-         InlineKeyboardButton("ℹ️ Помощь", callback_data="help")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.edit_message_text(
-        "📰 *Главное меню*\n\n"
-        "Выберите категорию новостей:",
-        reply_markup=reply_markup,
-        parse_mode='Markdown'
-    )
+    await edit_message(query, MAIN_MENU_TEXT, MAIN_KEYBOARD)
 
 async def show_help(query):
     """Показ справки"""
-    help_text = (
-        "ℹ️ *Помощь по боту*\n\n"
-        "*Источники новостей:*\n"
-        "• RIA Новости - федеральные\n"
-        "• ТАСС - федеральные\n"
-        "• БелПресса - Белгород\n" 
-        "• Бел.Ру - Белгород\n\n"
-        "*Как использовать:*\n"
-        "1. Выберите категорию новостей\n"
-        "2. Нажмите на ссылку для чтения\n"
-        "3. Используйте '🔄 Обновить' для актуальных новостей\n\n"
-        "📞 *Поддержка:* @Alex_De_White"
-    )
-    
-    keyboard = [
-        [InlineKeyboardButton("🇷🇺 Федеральные новости", callback_data="federal_news")],
-        [InlineKeyboardButton("🏙️ Новости Белгорода", callback_data="belgorod_news")],
-        [InlineKeyboardButton("🏠 Главное меню", callback_data="refresh_news")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.edit_message_text(
-        help_text,
-        reply_markup=reply_markup,
-        parse_mode='Markdown'
-    )
+    await edit_message(query, HELP_TEXT, HELP_KEYBOARD)
 
 # ===== ВЕБХУК ЭНДПОИНТЫ ДЛЯ RENDER =====
 async def webhook(request: Request) -> Response:
     """Эндпоинт для вебхуков от Telegram"""
+    # Очередь заполнена: отвечаем 503, и Telegram повторит доставку позже
+    if update_processor.pending >= WEBHOOK_MAX_PENDING:
+        update_processor.rejected += 1
+        return Response(status_code=503, headers={"Retry-After": "1"})
+    
     try:
-        data = await request.json()
+        data = json_loads(await request.body())
         update = Update.de_json(data, application.bot)
-        await application.update_queue.put(update)
+        application.update_queue.put_nowait(update)
+        update_processor.admit(update)
         return Response()
+    except asyncio.QueueFull:
+        update_processor.rejected += 1
+        return Response(status_code=503, headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"❌ Ошибка в вебхуке: {e}")
         return Response(status_code=500)
 
+# Счетчики компонентов читаются при выгрузке /metrics
+def cache_hit_ratio() -> dict:
+    hits = metrics.value('news_cache_requests_total', 'hit') + metrics.value('news_cache_requests_total', 'stale')
+    total = hits + metrics.value('news_cache_requests_total', 'miss')
+    return {(): hits / total if total else 0.0}
+
+metrics.collect('news_cache_hit_ratio', 'gauge', 'Доля запросов, отданных из кэша заголовков', (), cache_hit_ratio)
+metrics.collect('news_parse_queue_depth', 'gauge', 'Разборы в пуле: выполняются и ждут очереди', (),
+                lambda: {(): news_parser.parse_queue})
+metrics.collect('news_loads_total', 'counter', 'Загрузки источников и обслуженные ими вызовы', ('source', 'stat'),
+                lambda: {(source, stat): stats[stat] for source, stats in news_parser.flight_stats.items()
+                         for stat in ('fetches', 'callers')})
+metrics.collect('news_stream_total', 'counter', 'Потоковые загрузки: обрывы и байты', ('url', 'stat'),
+                lambda: {(url, stat): value for url, stats in news_parser.stream_stats.items()
+                         for stat, value in stats.items()})
+metrics.collect('news_source_available', 'gauge', 'Предохранитель источника замкнут (1) или разомкнут (0)', ('source',),
+                lambda: {(key,): int(breaker.available) for key, breaker in news_parser.breakers.items()})
+metrics.collect('news_source_timeout_seconds', 'gauge', 'Текущий адаптивный таймаут источника', ('source',),
+                lambda: {(key,): breaker.timeout for key, breaker in news_parser.breakers.items()})
+metrics.collect('headline_index_size', 'gauge', 'Заголовков в индексе inline-поиска', (),
+                lambda: {(): len(headline_index)})
+metrics.collect('webhook_pending', 'gauge', 'Апдейты, принятые вебхуком и еще не обработанные', (),
+                lambda: {(): update_processor.pending})
+metrics.collect('webhook_updates_total', 'counter', 'Апдейты вебхука: приняты и отклонены', ('result',),
+                lambda: {('accepted',): update_processor.accepted, ('rejected',): update_processor.rejected})
+metrics.collect('refresh_taps_total', 'counter', 'Нажатия кнопок новостей по решению ограничителя', ('verdict',),
+                lambda: {(verdict,): value for verdict, value in refresh_limiter.stats.items()})
+metrics.collect('digest_events_total', 'counter', 'События рассылки подписчикам', ('event',),
+                lambda: {(event,): value for event, value in digest_job.stats.items()})
+metrics.collect('telegram_edits_total', 'counter', 'Правки сообщений: отправлены, пропущены, не изменились', ('result',),
+                lambda: {(result,): value for result, value in shown_messages.stats.items()})
+metrics.collect('bot_ready', 'gauge', 'Воркер прогрет и готов к трафику', (),
+                lambda: {(): int(readiness.ready)})
+metrics.collect('startup_stage_seconds', 'gauge', 'Длительность этапов запуска процесса', ('stage',),
+                lambda: {(name,): duration for name, _, duration in startup_profile.stages})
+metrics.collect('article_store_events_total', 'counter', 'Записи и очистки хранилища новостей', ('event',),
+                lambda: {(event,): value for event, value in article_store.stats.items()})
+
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 async def health_check(request: Request) -> PlainTextResponse:
-    """Эндпоинт для проверки здоровья приложения"""
+    """Эндпоинт для проверки здоровья приложения (процесс жив, порт открыт)"""
     return PlainTextResponse("✅ Бот работает")
 
+async def ready_check(request: Request) -> PlainTextResponse:
+    """Готовность к трафику: 503, пока кэши не прогреты"""
+    if not readiness.ready:
+        return PlainTextResponse("⏳ Прогрев кэшей", status_code=503)
+    return PlainTextResponse("✅ Бот готов")
+
 async def set_webhook():
     """Установка вебхука при запуске"""
     if WEBHOOK_URL:
@@ -553,38 +2649,136 @@ async def set_webhook():
         logger.warning("⚠️ RENDER_EXTERNAL_URL не установлен, вебхук не настроен")
 
 # ===== РЕГИСТРАЦИЯ ОБРАБОТЧИКОВ =====
+COMMANDS = {
+    "start": start,
+    "help": help_command,
+    "news": news_command,
+    "subscribe": subscribe_command,
+    "unsubscribe": unsubscribe_command,
+}
+
 def setup_handlers():
     """Регистрация всех обработчиков"""
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("news", news_command))
+    for command, callback in COMMANDS.items():
+        application.add_handler(CommandHandler(command, callback))
     application.add_handler(CallbackQueryHandler(button_handler))
+    application.add_handler(InlineQueryHandler(inline_query))
 
 # ===== ЗАПУСК ПРИЛОЖЕНИЯ =====
-async def main():
-    """Основная функция запуска"""
+class Readiness:
+    """Прогрев воркера в фоне: порт открывается сразу, /ready отвечает 200 после прогрева"""
+    
+    def __init__(self):
+        self.ready = False
+        self._task = None
+    
+    def start(self, coroutine):
+        self._task = asyncio.create_task(coroutine)
+    
+    async def aclose(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+readiness = Readiness()
+# Фоновые циклы воркера (рассылка, запись хранилища): отменяются при остановке
+background_tasks = set()
+
+async def register_webhook():
+    """Установка вебхука (при нескольких воркерах - одним из них)"""
+    with startup_profile.stage('set_webhook'):
+        if await cluster_lock('set_webhook', 60):
+            await set_webhook()
+
+async def seed_headline_index():
+    """Индекс поиска сразу знает заголовки, сохраненные до перезапуска"""
+    with startup_profile.stage('headline_index'):
+        for news in await article_store.recent(INDEX_MAX_ITEMS):
+            headline_index.add(news)
+
+async def warm_up_news():
+    with startup_profile.stage('warm_up'):
+        await news_parser.warm_up(news_parser.requests_for('federal') + news_parser.requests_for('belgorod'))
+
+async def prepare():
+    """Вебхук, индекс поиска и кэш новостей готовятся одновременно, уже при открытом порте.
+    
+    Апдейты, пришедшие до конца прогрева, обрабатываются как обычно: их
+    загрузки присоединяются к загрузкам прогрева того же источника.
+    """
+    stages = {'вебхук': register_webhook(), 'индекс поиска': seed_headline_index(), 'прогрев кэша': warm_up_news()}
+    # Сбой одного этапа не должен оставить воркер навсегда неготовым: бот работает и без прогрева
+    results = await asyncio.gather(*stages.values(), return_exceptions=True)
+    for stage, result in zip(stages, results):
+        if isinstance(result, Exception):
+            logger.error(f"❌ Ошибка подготовки ({stage}): {result!r}")
+    readiness.ready = True
+    logger.info(f"🤖 Бот готов к работе за {startup_profile.elapsed():.2f} с")
+    if STARTUP_PROFILE:
+        logger.info("⏱ Профиль запуска:\n" + startup_profile.report())
+
+async def startup():
+    """Запуск Telegram-приложения и фоновых задач в процессе воркера"""
     logger.info("🔄 Инициализация новостного бота...")
     
     # Регистрируем обработчики
-    setup_handlers()
+    with startup_profile.stage('setup_handlers'):
+        setup_handlers()
     
     # Запускаем приложение
-    await application.initialize()
-    await application.start()
+    with startup_profile.stage('application.start'):
+        await application.initialize()
+        await application.start()
+    
+    # Прогрев не задерживает открытие порта
+    readiness.start(prepare())
     
-    # Устанавливаем вебхук
-    await set_webhook()
+    # Рассылка подписчикам работает в фоне рядом с сервером
+    background_tasks.add(asyncio.create_task(digest_job.run(application.bot)))
+    background_tasks.add(asyncio.create_task(article_store.run()))
+
+async def shutdown():
+    """Остановка приложения, закрытие соединений и запись накопленных данных"""
+    await readiness.aclose()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
     
-    # Создаем Starlette приложение
-    starlette_app = Starlette(routes=[
+    # Получатель апдейтов игнорирует отмену задачи, остановить его может только stop()
+    if application.running:
+        await application.stop()
+    await application.shutdown()
+    await news_parser.aclose()
+    await article_store.aclose()
+    if cache_backend is not None:
+        await cache_backend.aclose()
+
+@contextlib.asynccontextmanager
+async def lifespan(app: Starlette):
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
+
+def create_app() -> Starlette:
+    """Starlette-приложение бота; uvicorn вызывает его в каждом воркере"""
+    return Starlette(routes=[
         Route("/webhook", webhook, methods=["POST"]),
         Route("/healthcheck", health_check, methods=["GET"]),
+        Route("/ready", ready_check, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
         Route("/", health_check, methods=["GET"]),
-    ])
+    ], lifespan=lifespan)
+
+async def main():
+    """Основная функция запуска (один процесс)"""
+    import uvicorn
     
-    # Запускаем сервер
     config = uvicorn.Config(
-        app=starlette_app,
+        app=create_app(),
         host="0.0.0.0",
         port=PORT,
         log_level="info"
@@ -592,9 +2786,32 @@ async def main():
     server = uvicorn.Server(config)
     
     logger.info(f"✅ Новостной бот запущен на порту {PORT}")
-    logger.info("🤖 Бот готов к работе!")
-    
     await server.serve()
 
+def run_workers():
+    """Запуск WEB_CONCURRENCY процессов uvicorn, загрузки сайтов делятся через общий кэш"""
+    import uvicorn
+    
+    if cache_backend is None:
+        # Без общего кэша cluster_lock есть у каждого воркера: рассылка ушла бы
+        # подписчикам WEB_CONCURRENCY раз, а вебхук устанавливал бы каждый
+        logger.error("❌ WEB_CONCURRENCY > 1 требует общего кэша: CACHE_BACKEND=sqlite или redis")
+        raise SystemExit(1)
+    module = os.path.splitext(os.path.basename(__file__))[0]
+    logger.info(f"✅ Новостной бот запускается на порту {PORT}: {WEB_CONCURRENCY} воркеров, кэш {CACHE_BACKEND}")
+    uvicorn.run(
+        f"{module}:create_app",
+        factory=True,
+        host="0.0.0.0",
+        port=PORT,
+        workers=WEB_CONCURRENCY,
+        log_level="info"
+    )
+
+startup_profile.mark('init module')
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    if WEB_CONCURRENCY > 1:
+        run_workers()
+    else:
+        asyncio.run(main())
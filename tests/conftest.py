@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Бот читает токен при импорте, для тестов подойдет любой
+os.environ.setdefault("BOT_TOKEN", "0:tests")
+os.environ.setdefault("ARTICLE_DB", os.path.join(tempfile.mkdtemp(prefix="tests-articles-"), "articles.db"))
+sys.path.insert(0, ROOT)
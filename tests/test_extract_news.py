@@ -0,0 +1,28 @@
+"""Быстрый разбор (SoupStrainer) совпадает с полным на снимках страниц источников"""
+import os
+
+import pytest
+
+import botNNN
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures")
+
+
+def read_fixture(key: str) -> str:
+    with open(os.path.join(FIXTURES, key + ".html"), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("backend", [
+    "html.parser",
+    pytest.param("lxml", marks=pytest.mark.skipif(not botNNN.HAS_LXML, reason="lxml не установлен")),
+])
+@pytest.mark.parametrize("key", sorted(botNNN.SOURCES))
+@pytest.mark.parametrize("max_news", [1, 3, 4, 6, 10])
+def test_fast_parse_matches_full(key, max_news, backend, monkeypatch):
+    monkeypatch.setattr(botNNN, "NEWS_HTML_BACKEND", backend)
+    source = botNNN.SOURCES[key]
+    html = read_fixture(key)
+    full = botNNN.extract_news(html, max_news, source, fast=False)
+    assert full, "на снимке не найдено ни одной новости"
+    assert botNNN.extract_news(html, max_news, source, fast=True) == full
@@ -0,0 +1,144 @@
+"""RedisBackend против локальной заглушки протокола RESP"""
+import asyncio
+import time
+
+import pytest
+
+import botNNN
+
+
+class RespStub:
+    """Redis в памяти: GET, SET с NX/XX/PX, EVAL скрипта снятия блокировки, AUTH, SELECT"""
+
+    def __init__(self, password: str = None):
+        self.password = password
+        self.data = {}  # ключ -> (значение, срок в time.monotonic() или None)
+        self.commands = []
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        authenticated = self.password is None
+        try:
+            while line := await reader.readline():
+                args = []
+                for _ in range(int(line[1:-2])):
+                    size = int((await reader.readline())[1:-2])
+                    args.append((await reader.readexactly(size + 2))[:-2])
+                command = args[0].decode().upper()
+                self.commands.append(command)
+                if command == 'AUTH':
+                    authenticated = args[1].decode() == self.password
+                    reply = b'+OK\r\n' if authenticated else b'-WRONGPASS invalid password\r\n'
+                elif not authenticated:
+                    reply = b'-NOAUTH Authentication required.\r\n'
+                else:
+                    reply = self.execute(command, args[1:])
+                writer.write(reply)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def get(self, key: bytes):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, command: str, args: list) -> bytes:
+        if command == 'SELECT':
+            return b'+OK\r\n'
+        if command == 'GET':
+            value = self.get(args[0])
+            return b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+        if command == 'SET':
+            key, value, options = args[0], args[1], [arg.decode().upper() for arg in args[2:]]
+            exists = self.get(key) is not None
+            if ('NX' in options and exists) or ('XX' in options and not exists):
+                return b'$-1\r\n'
+            expires = None
+            if 'PX' in options:
+                expires = time.monotonic() + int(options[options.index('PX') + 1]) / 1000
+            self.data[key] = (value, expires)
+            return b'+OK\r\n'
+        if command == 'EVAL' and args[0] == botNNN.RedisBackend.RELEASE_SCRIPT.encode():
+            key, owner = args[2], args[3]
+            if self.get(key) == owner:
+                del self.data[key]
+                return b':1\r\n'
+            return b':0\r\n'
+        return b'-ERR unknown command\r\n'
+
+
+def run_with_stub(scenario, password: str = None):
+    async def main():
+        stub = RespStub(password)
+        port = await stub.start()
+        try:
+            await scenario(stub, port)
+        finally:
+            await stub.stop()
+
+    asyncio.run(main())
+
+
+def test_get_set_with_ttl():
+    async def scenario(stub, port):
+        backend = botNNN.RedisBackend(f'redis://127.0.0.1:{port}/1')
+        assert await backend.get('news:ria') is None
+        await backend.set('news:ria', {'items': [['Заголовок', 'http://x/1', 'РИА']]}, 0.05)
+        assert await backend.get('news:ria') == {'items': [['Заголовок', 'http://x/1', 'РИА']]}
+        await asyncio.sleep(0.1)
+        assert await backend.get('news:ria') is None
+        await backend.aclose()
+
+    run_with_stub(scenario)
+
+
+def test_acquire_renew_release():
+    async def scenario(stub, port):
+        first = botNNN.RedisBackend(f'redis://127.0.0.1:{port}/0', owner='first')
+        second = botNNN.RedisBackend(f'redis://127.0.0.1:{port}/0', owner='second')
+        assert await first.acquire('fetch:ria', 5)
+        assert not await second.acquire('fetch:ria', 5)
+        assert await first.acquire('fetch:ria', 5)  # продление своей блокировки
+
+        # Чужая блокировка не снимается
+        await second.release('fetch:ria')
+        assert not await second.acquire('fetch:ria', 5)
+
+        await first.release('fetch:ria')
+        assert await second.acquire('fetch:ria', 5)
+        assert 'DEL' not in stub.commands
+        await first.aclose()
+        await second.aclose()
+
+    run_with_stub(scenario)
+
+
+def test_reconnects_after_failed_auth():
+    async def scenario(stub, port):
+        backend = botNNN.RedisBackend(f'redis://:wrong@127.0.0.1:{port}/0')
+        with pytest.raises(botNNN.BackendError):
+            await backend.get('key')
+        # Пароль исправлен: следующий вызов проходит AUTH заново, а не получает NOAUTH
+        backend.password = 'secret'
+        assert await backend.get('key') is None
+        assert stub.commands.count('AUTH') == 2
+        await backend.aclose()
+
+    run_with_stub(scenario, password='secret')
+
+
+def test_rejects_unsupported_scheme():
+    with pytest.raises(ValueError):
+        botNNN.RedisBackend('rediss://127.0.0.1:6380/0')
@@ -0,0 +1,21 @@
+"""Одновременные изменения подписок не теряются ни в памяти, ни в файле"""
+import asyncio
+import json
+
+import botNNN
+
+
+def test_concurrent_add_and_remove(tmp_path):
+    path = tmp_path / "subscriptions.json"
+
+    async def scenario():
+        subscriptions = botNNN.Subscriptions(str(path))
+        await asyncio.gather(*(subscriptions.add(chat_id, 'federal') for chat_id in range(20)))
+        await asyncio.gather(*(subscriptions.remove(chat_id) for chat_id in range(0, 20, 2)))
+        return subscriptions
+
+    subscriptions = asyncio.run(scenario())
+    expected = set(range(1, 20, 2))
+    assert subscriptions.chats['federal'] == expected
+    assert set(json.loads(path.read_text())['federal']) == expected
+    assert not list(tmp_path.glob("*.tmp"))